@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+import json
+import math
+import sys
+import time
+
+import inputs
+
+# A Barnes-Hut tree in any number of dimensions: each node is a cube
+# which is split into 2 ** D children (a quadtree in 2D, an octree in
+# 3D...) until each leaf holds a single body. Far away nodes are then
+# treated as a single body at their centre of mass, which makes each
+# step O(N log N) instead of O(N ** 2).
+
+# nodes holding bodies this close together aren't split any further
+MAX_DEPTH = 48
+
+class Node(object):
+    """A cube of space, of the given size around centre, and the total
+    mass and centre of mass within it."""
+    
+    __slots__ = ("size", "mass", "centre_of_mass", "children", "bodies", "centre")
+    
+    def __init__(self, size, mass, centre_of_mass, children=None, bodies=None, centre=None):
+        self.size = size
+        self.mass = mass
+        self.centre_of_mass = centre_of_mass
+        self.children = children
+        self.bodies = bodies
+        self.centre = centre
+    
+    def contains(self, position):
+        """Returns whether position is within (or on the edge of) our cube."""
+        
+        half = self.size / 2
+        
+        return all(abs(p - c) <= half for p, c in zip(position, self.centre))
+
+def build_tree(positions, masses):
+    """Returns the root Node of a tree containing the given bodies.
+    
+    positions is a sequence of equal-length sequences of coordinates."""
+    
+    if not positions:
+        return None
+    
+    dimensions = len(positions[0])
+    lows = [ min(p[k] for p in positions) for k in range(dimensions) ]
+    highs = [ max(p[k] for p in positions) for k in range(dimensions) ]
+    
+    size = max(high - low for low, high in zip(lows, highs)) or 1.0
+    centre = [ (low + high) / 2 for low, high in zip(lows, highs) ]
+    
+    def build(indices, centre, size, depth):
+        mass = sum(masses[i] for i in indices)
+        
+        if mass:
+            centre_of_mass = [ sum(masses[i] * positions[i][k] for i in indices) / mass
+                               for k in range(dimensions) ]
+        else:
+            centre_of_mass = list(centre)
+        
+        if len(indices) == 1 or depth >= MAX_DEPTH:
+            return Node(size, mass, centre_of_mass, bodies=indices, centre=centre)
+        
+        # the bits of each body's orthant key say which side of the
+        # centre it falls on along each axis
+        orthants = {}
+        
+        for i in indices:
+            position = positions[i]
+            key = 0
+            
+            for k in range(dimensions):
+                if position[k] >= centre[k]:
+                    key |= 1 << k
+            
+            orthants.setdefault(key, []).append(i)
+        
+        quarter = size / 4
+        children = []
+        
+        for key, child_indices in orthants.items():
+            child_centre = [ c + quarter if key & (1 << k) else c - quarter
+                             for k, c in enumerate(centre) ]
+            children.append(build(child_indices, child_centre, size / 2, depth + 1))
+        
+        return Node(size, mass, centre_of_mass, children=children, centre=centre)
+    
+    return build(list(range(len(positions))), centre, size, 0)
+
+def accelerations(positions, masses, G, theta=.5, stats=None):
+    """Returns the approximate gravitational acceleration of each body.
+    
+    A node is treated as a single body when its size over its distance is
+    less than theta, unless the body is within it, as then it would pull
+    itself; theta = 0 opens every node, giving the direct sum.
+    Like simulate(), pairs closer than .5 are ignored. If a stats dict is
+    given, the number of body-body and body-node interactions summed is
+    added to its "interactions"."""
+    
+    root = build_tree(positions, masses)
+    results = []
+    interactions = 0
+    
+    for i, position in enumerate(positions):
+        acceleration = [ 0.0 ] * len(position)
+        stack = [ root ] if root is not None else []
+        
+        while stack:
+            node = stack.pop()
+            
+            if node.bodies is not None:
+                # leaf: sum its bodies directly
+                for j in node.bodies:
+                    if j == i: continue
+                    
+                    interactions += 1
+                    other = positions[j]
+                    separation = [ o - p for o, p in zip(other, position) ]
+                    distance = math.sqrt(sum(s * s for s in separation))
+                    
+                    if distance > .5:
+                        factor = G * masses[j] / distance ** 3
+                        
+                        for k, s in enumerate(separation):
+                            acceleration[k] += factor * s
+                
+                continue
+            
+            separation = [ c - p for c, p in zip(node.centre_of_mass, position) ]
+            distance = math.sqrt(sum(s * s for s in separation))
+            
+            if distance and node.size / distance < theta and not node.contains(position):
+                interactions += 1
+                
+                if distance > .5:
+                    factor = G * node.mass / distance ** 3
+                    
+                    for k, s in enumerate(separation):
+                        acceleration[k] += factor * s
+            else:
+                stack.extend(node.children)
+        
+        results.append(acceleration)
+    
+    if stats is not None:
+        stats["interactions"] = stats.get("interactions", 0) + interactions
+    
+    return results
+
+def direct_accelerations(positions, masses, G):
+    """Returns the exact all-pairs gravitational acceleration of each body."""
+    
+    try:
+        import numpy
+        from gravity import numpy_accelerations
+    except ImportError:
+        return accelerations(positions, masses, G, theta=0)
+    
+    return numpy_accelerations(numpy.array(positions, dtype=numpy.float64),
+                               numpy.array(masses, dtype=numpy.float64), G).tolist()
+
+def accuracy_report(positions, masses, G, thetas=(.3, .5, .7, 1.0)):
+    """Compares accelerations() at each theta against the direct sum.
+    
+    Returns a dict of the direct sum's time and, for each theta, its time
+    and the max, mean and median relative error in acceleration."""
+    
+    start = time.time()
+    exact = direct_accelerations(positions, masses, G)
+    report = { "bodies": len(positions),
+               "direct seconds": time.time() - start,
+               "thetas": [] }
+    
+    for theta in thetas:
+        start = time.time()
+        approximate = accelerations(positions, masses, G, theta)
+        seconds = time.time() - start
+        
+        errors = []
+        
+        for a, e in zip(approximate, exact):
+            magnitude = math.sqrt(sum(x * x for x in e))
+            
+            if magnitude:
+                errors.append(math.sqrt(sum((x - y) ** 2 for x, y in zip(a, e))) / magnitude)
+        
+        errors.sort()
+        
+        report["thetas"].append({ "theta": theta,
+                                  "seconds": seconds,
+                                  "max relative error": errors[-1] if errors else 0,
+                                  "mean relative error": sum(errors) / len(errors) if errors else 0,
+                                  "median relative error": errors[len(errors) // 2] if errors else 0 })
+    
+    return report
+
+def main(in_filename="-", *thetas):
+    """Writes an accuracy_report() for a gravity.py input file as JSON."""
+    
+    in_file = open(in_filename, "rb") if in_filename != "-" else sys.stdin.buffer
+    
+    with in_file:
+        input_dict = inputs.read(in_file) # JSON or columnar, see inputs.py
+    
+    # a System's displacements all have its number of dimensions
+    system = input_dict["objects"]
+    positions = [ list(o.displacement) for o in system ]
+    masses = list(system.masses)
+    
+    report = accuracy_report(positions, masses, input_dict.get("G", 6.67428e-11),
+                             [ float(t) for t in thetas ] or (.3, .5, .7, 1.0))
+    
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
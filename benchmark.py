@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+import io
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import ensemble
+import gravity
+import raster
+import scenes
+
+# Each benchmark gives a rate, eg. steps per second, keyed by a name like
+# "simulate/numpy/n=1000". Results are written as JSON, and may be saved
+# and passed back in as a baseline to compare a later run against.
+#
+#     ./benchmark.py > baseline.json
+#     ./benchmark.py --baseline=baseline.json simulate > results.json
+
+SIMULATE_SIZES = (10, 100, 1000, 10000)
+DOT_RADII = (.5, 2, 8, 32)
+BMP_SIZES = (256, 1024, 4096)
+ENSEMBLE_SIZES = (10, 100, 1000)
+SCENE_SIZE = 1000 # bodies in each scene stepped
+SCENE_GENERATE_SIZE = 100000 # and generated
+
+# roughly how each engine's step time grows with N, to skip sizes which
+# would take too long
+SCALING = { "python": 2, "numpy": 2, "barnes-hut": 1.2 }
+
+def dust(n, seed=0):
+    """Returns a list of n Objects like those dusty.input.json.py makes,
+    spread out so that they're as dense as its 100 are."""
+    
+    generator = random.Random(seed)
+    r = lambda: generator.random() * 2 - 1
+    
+    d_max = 200 * math.sqrt(n / 100)
+    v_max = 1
+    
+    return [ gravity.Object(1, [ r() * d_max, r() * d_max ], [ r() * v_max, r() * v_max ], 2)
+             for _ in range(n) ]
+
+def rate(function, min_time=.5):
+    """Calls function until min_time has passed and returns the number of
+    calls per second."""
+    
+    calls = 0
+    start = time.perf_counter()
+    
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        
+        if elapsed >= min_time:
+            return calls / elapsed
+
+def bench_simulate(results, min_time=.5, max_step_time=10):
+    """Times steps/sec of each engine across SIMULATE_SIZES. Sizes a step
+    of which would take more than max_step_time, going by the last size
+    and SCALING, are skipped."""
+    
+    for name, engine in sorted(gravity.engines.items()):
+        if name == "numpy" and numpy is None:
+            continue
+        
+        last = None
+        
+        for n in SIMULATE_SIZES:
+            key = "simulate/{}/n={}".format(name, n)
+            
+            if last is not None and (n / last[0]) ** SCALING.get(name, 2) / last[1] > max_step_time:
+                results[key] = { "skipped": True, "unit": "steps/s" }
+                continue
+            
+            frames = engine(dust(n), 1, G=1)
+            next(frames) # the initial state
+            
+            steps = rate(lambda: next(frames), min_time)
+            results[key] = { "rate": steps, "unit": "steps/s" }
+            last = (n, steps)
+
+def bench_dot(results, min_time=.5, size=512, count=1000):
+    """Times dots/sec drawn by Raster.dot() and, with numpy, by
+    Raster_24RGB.dots(), with and without a StampCache, and
+    Raster_Float_RGB.dots(), across DOT_RADII."""
+    
+    generator = random.Random(0)
+    positions = [ (generator.random() * size, generator.random() * size) for _ in range(count) ]
+    
+    for radius in DOT_RADII:
+        image = raster.Raster_24RGB(size, size, pen=raster.PEN_MAX)
+        
+        # fewer big dots, so each call takes roughly as long
+        subset = positions[:max(10, count // (1 + int(radius) ** 2))]
+        
+        def dot():
+            for position in subset:
+                image.dot(position, [ .2, .5, .9 ], .8, radius=radius)
+        
+        results["dot/radius={}".format(radius)] = { "rate": rate(dot, min_time) * len(subset), "unit": "dots/s" }
+        
+        if numpy is not None:
+            dots = lambda: image.dots(positions, [ .2, .5, .9 ], .8, radius=radius)
+            results["dots/radius={}".format(radius)] = { "rate": rate(dots, min_time) * count, "unit": "dots/s" }
+            
+            accumulating = raster.Raster_Float_RGB(size, size, pen=raster.PEN_ADD)
+            dots = lambda: accumulating.dots(positions, [ .2, .5, .9 ], .8, radius=radius)
+            results["dots/float/radius={}".format(radius)] = { "rate": rate(dots, min_time) * count, "unit": "dots/s" }
+            
+            stamped = raster.Raster_24RGB(size, size, pen=raster.PEN_MAX, stamps=raster.StampCache())
+            dots = lambda: stamped.dots(positions, [ .2, .5, .9 ], .8, radius=radius)
+            results["dots/stamps/radius={}".format(radius)] = { "rate": rate(dots, min_time) * count, "unit": "dots/s" }
+
+def bench_gradient(results, min_time=.5, count=1000):
+    """Times RGBA_Gradient lookups/sec on mah_spectrum, one at a time and
+    in a batch from its lookup table."""
+    
+    generator = random.Random(0)
+    points = [ generator.random() for _ in range(count) ]
+    
+    def lookups():
+        for point in points:
+            raster.mah_spectrum(point)
+    
+    results["gradient"] = { "rate": rate(lookups, min_time) * count, "unit": "lookups/s" }
+    
+    batch = numpy.array(points) if numpy is not None else points
+    table_lookups = lambda: raster.mah_spectrum.colors(batch)
+    results["gradient/table"] = { "rate": rate(table_lookups, min_time) * count, "unit": "lookups/s" }
+
+def bench_write_bmp(results, min_time=.5):
+    """Times write_bmp() MB/sec across BMP_SIZES."""
+    
+    for size in BMP_SIZES:
+        image = raster.Raster_24RGB(size, size)
+        image.data[:] = bytes(random.Random(0).getrandbits(8) for _ in range(256)) * (len(image.data) // 256)
+        
+        def write():
+            image.write_bmp(io.BytesIO())
+        
+        megabytes = size * size * 3 / 1e6
+        results["write_bmp/{}x{}".format(size, size)] = { "rate": rate(write, min_time) * megabytes,
+                                                          "unit": "MB/s" }
+
+def bench_ensemble(results, min_time=.5, bodies=10):
+    """Times system-steps/sec of simulate_ensemble() stepping
+    ENSEMBLE_SIZES systems of bodies each, to compare against
+    simulate/*/n=10."""
+    
+    if numpy is None:
+        return
+    
+    for size in ENSEMBLE_SIZES:
+        frames = ensemble.simulate_ensemble(ensemble.Ensemble.from_systems([ dust(bodies, seed)
+                                                                             for seed in range(size) ]), 1, G=1)
+        next(frames) # the initial state
+        
+        results["ensemble/systems={}".format(size)] = { "rate": rate(lambda: next(frames), min_time) * size,
+                                                        "unit": "system-steps/s" }
+
+def bench_scenes(results, min_time=.5):
+    """Times bodies/sec of generating each scene in scenes.py, and
+    steps/sec of the numpy and barnes-hut engines on SCENE_SIZE bodies of
+    it, always with seed 0 so the workloads stay the same."""
+    
+    if numpy is None:
+        return
+    
+    options = { "rings": { "system": os.path.join(os.path.dirname(os.path.abspath(__file__)), "sol.system.json") } }
+    
+    for name, scene in sorted(scenes.scenes.items()):
+        generate = lambda: scene(SCENE_GENERATE_SIZE, 0, **options.get(name, {}))
+        results["scenes/{}/generate".format(name)] = { "rate": rate(generate, min_time) * SCENE_GENERATE_SIZE,
+                                                       "unit": "bodies/s" }
+        
+        input_dict = scene(SCENE_SIZE, 0, **options.get(name, {}))
+        time_step = input_dict["dt"] / (input_dict["frames"] - 1)
+        
+        for engine in ("numpy", "barnes-hut"):
+            frames = gravity.engines[engine](input_dict["objects"], time_step, G=input_dict["G"])
+            next(frames) # the initial state
+            
+            results["scenes/{}/{}".format(name, engine)] = { "rate": rate(lambda: next(frames), min_time),
+                                                             "unit": "steps/s" }
+
+suites = { "simulate": bench_simulate,
+           "dot": bench_dot,
+           "gradient": bench_gradient,
+           "write_bmp": bench_write_bmp,
+           "ensemble": bench_ensemble,
+           "scenes": bench_scenes }
+
+def compare(results, baseline, tolerance=.2):
+    """Returns a dict of the ratio of each rate to the baseline's, and a
+    list of the names of those more than tolerance slower."""
+    
+    ratios = {}
+    regressions = []
+    
+    for key, result in sorted(results.items()):
+        old = baseline.get(key, {})
+        
+        if "rate" in result and old.get("rate"):
+            ratios[key] = result["rate"] / old["rate"]
+            
+            if ratios[key] < 1 - tolerance:
+                regressions.append(key)
+    
+    return ratios, regressions
+
+def main(*arguments):
+    """Runs the named suites (or all of them) and writes the results as
+    JSON. With --baseline=FILE, compares them against an earlier run's
+    and returns 1 if any got slower by more than --tolerance=FRACTION
+    (.2 by default; timings are noisy)."""
+    
+    baseline_filename = None
+    tolerance = .2
+    names = []
+    
+    for argument in arguments:
+        if argument.startswith("--baseline="):
+            baseline_filename = argument.split("=", 1)[1]
+        elif argument.startswith("--tolerance="):
+            tolerance = float(argument.split("=", 1)[1])
+        elif argument in suites:
+            names.append(argument)
+        else:
+            raise ValueError("unknown suite {!r}; expected one of {}".format(argument, ", ".join(sorted(suites))))
+    
+    results = {}
+    
+    for name in names or sorted(suites):
+        sys.stderr.write("Running {} benchmarks...\n".format(name))
+        suites[name](results)
+    
+    output = { "python": platform.python_version(),
+               "numpy": numpy.__version__ if numpy is not None else None,
+               "results": results }
+    
+    if baseline_filename is not None:
+        with open(baseline_filename, "rt") as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        
+        ratios, regressions = compare(results, baseline, tolerance)
+        output["baseline ratios"] = ratios
+        output["regressions"] = regressions
+        
+        for key, ratio in sorted(ratios.items()):
+            sys.stderr.write("{:<32} {:6.2f}x{}\n".format(key, ratio, "  REGRESSION" if key in regressions else ""))
+    
+    json.dump(output, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
+    
+    return 1 if output.get("regressions") else 0
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+from array import array
+import sys
+
+# Helpers shared by the binary formats (checkpoints, trajectories and
+# columnar inputs), which are all little-endian with arrays starting on
+# multiples of 8 bytes.
+
+def padding(size):
+    """Returns the zero bytes to follow size bytes to reach a multiple of 8."""
+    
+    return bytes(-size % 8)
+
+def little_endian(values):
+    """Returns an array's values in little-endian byte order: the array
+    itself on little-endian hosts, otherwise a byteswapped copy. values
+    is never changed."""
+    
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    
+    return values
+
+def extend_little_endian(values, data):
+    """Appends the items in data, little-endian bytes, to the array values."""
+    
+    if sys.byteorder == "big":
+        items = array(values.typecode)
+        items.frombytes(data)
+        items.byteswap()
+        values.extend(items)
+    else:
+        values.frombytes(data)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+from array import array
+from copy import copy
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from vector import Vector, sqrt
+
+# The bodies gravity.py simulates, one at a time as Objects or a whole
+# system of them at once as a System, and numpy views of Systems.
+
+class Object(object):
+    """A non-elastic frictionless sphere in a vaccum, ha."""
+    
+    __slots__ = ("mass", "displacement", "velocity", "radius", "combining")
+    
+    def __init__(self, mass, displacement, velocity, radius=None, combining=True):
+        self.mass = mass
+        self.displacement = Vector(displacement)
+        self.velocity = Vector(velocity)
+        
+        if radius is None:
+            self.radius = 2 * sqrt(self.mass)
+        else:
+            self.radius = radius
+
+        self.combining = bool(combining)
+
+    from_dict_defaults = { "m": 1, "d": [ 0, 0 ], "v": [ 0, 0 ],
+                           "radius": None, "combining": True }
+    
+    @classmethod
+    def from_dict(cls, source_dict):
+        # no need to copy the defaults, as Vectors copy their components
+        get = lambda key: source_dict.get(key, cls.from_dict_defaults[key])
+        return cls(get("m"), get("d"), get("v"), get("radius"), get("combining"))
+
+    def __repr__(self):
+        return ("{.__name__}(mass={!r}, displacement={!r}, velocity={!r}, radius={!r}, combining={!r})"
+                .format(type(self), self.mass, self.displacement, self.velocity, self.radius, self.combining))
+
+class System(object):
+    """A whole system of Objects stored as a structure of arrays.
+
+    Each field is a single flat array of doubles (bytes for combining),
+    with displacements and velocities holding dimensions components per
+    object, so a system is a handful of contiguous buffers that numpy can
+    view without copying. Indexing or iterating over a System gives
+    SystemObjects viewing into it."""
+    
+    __slots__ = ("dimensions", "masses", "displacements", "velocities", "radii", "combining")
+    
+    def __init__(self, objects=(), dimensions=None):
+        if isinstance(objects, System) and dimensions in (None, objects.dimensions):
+            # just copy its arrays
+            for field in self.__slots__:
+                setattr(self, field, copy(getattr(objects, field)))
+            
+            return
+        
+        objects = list(objects)
+        
+        if dimensions is None:
+            dimensions = max([ len(list(o.displacement)) for o in objects ] +
+                             [ len(list(o.velocity)) for o in objects ] + [ 2 ])
+        
+        self.dimensions = dimensions
+        self.masses = array("d")
+        self.displacements = array("d")
+        self.velocities = array("d")
+        self.radii = array("d")
+        self.combining = array("b")
+        
+        for object in objects:
+            self.append(object)
+    
+    def append(self, object):
+        for components, vector in [ (self.displacements, object.displacement),
+                                    (self.velocities, object.velocity) ]:
+            vector = list(vector)
+            
+            if len(vector) > self.dimensions:
+                raise ValueError("{}-dimensional vector in {}-dimensional System"
+                                 .format(len(vector), self.dimensions))
+            
+            components.extend(vector + [ 0 ] * (self.dimensions - len(vector)))
+        
+        self.masses.append(object.mass)
+        self.radii.append(object.radius)
+        self.combining.append(bool(object.combining))
+    
+    def __len__(self):
+        return len(self.masses)
+    
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        
+        if not 0 <= index < len(self):
+            raise IndexError("System index out of range")
+        
+        return SystemObject(self, index)
+    
+    def __iter__(self):
+        return (SystemObject(self, i) for i in range(len(self)))
+    
+    def __repr__(self):
+        return "{.__name__}({!r})".format(type(self), list(self))
+
+class SystemObject(Object):
+    """An Object viewing into (and modifying) one entry of a System."""
+    
+    __slots__ = ("system", "index")
+    
+    def __init__(self, system, index):
+        self.system = system
+        self.index = index
+    
+    def _slice(self):
+        d = self.system.dimensions
+        return slice(self.index * d, (self.index + 1) * d)
+    
+    def _padded(self, vector):
+        vector = list(vector)
+        return array("d", vector + [ 0 ] * (self.system.dimensions - len(vector)))
+    
+    @property
+    def mass(self):
+        return self.system.masses[self.index]
+    
+    @mass.setter
+    def mass(self, value):
+        self.system.masses[self.index] = value
+    
+    @property
+    def displacement(self):
+        return Vector(self.system.displacements[self._slice()])
+    
+    @displacement.setter
+    def displacement(self, value):
+        self.system.displacements[self._slice()] = self._padded(value)
+    
+    @property
+    def velocity(self):
+        return Vector(self.system.velocities[self._slice()])
+    
+    @velocity.setter
+    def velocity(self, value):
+        self.system.velocities[self._slice()] = self._padded(value)
+    
+    @property
+    def radius(self):
+        return self.system.radii[self.index]
+    
+    @radius.setter
+    def radius(self, value):
+        self.system.radii[self.index] = value
+    
+    @property
+    def combining(self):
+        return bool(self.system.combining[self.index])
+    
+    @combining.setter
+    def combining(self, value):
+        self.system.combining[self.index] = bool(value)
+
+def copy_objects(objects):
+    """Returns a list of Objects copying those of any iterable of them,
+    eg. a System."""
+    
+    return [ Object(o.mass, o.displacement, o.velocity, o.radius, o.combining) for o in objects ]
+
+def numpy_views(system):
+    """Returns numpy arrays of a System's masses, displacements,
+    velocities, radii and combining flags, sharing its memory."""
+    
+    return (numpy.frombuffer(system.masses, dtype=numpy.float64),
+            numpy.frombuffer(system.displacements, dtype=numpy.float64).reshape(-1, system.dimensions),
+            numpy.frombuffer(system.velocities, dtype=numpy.float64).reshape(-1, system.dimensions),
+            numpy.frombuffer(system.radii, dtype=numpy.float64),
+            numpy.frombuffer(system.combining, dtype=numpy.int8).view(bool))
+
+def numpy_system(masses, displacements, velocities, radii, combining):
+    """Returns a new System holding copies of the given numpy arrays."""
+    
+    system = System(dimensions=displacements.shape[1])
+    
+    system.masses.frombytes(numpy.ascontiguousarray(masses, dtype=numpy.float64).tobytes())
+    system.displacements.frombytes(numpy.ascontiguousarray(displacements, dtype=numpy.float64).tobytes())
+    system.velocities.frombytes(numpy.ascontiguousarray(velocities, dtype=numpy.float64).tobytes())
+    system.radii.frombytes(numpy.ascontiguousarray(radii, dtype=numpy.float64).tobytes())
+    system.combining.frombytes(numpy.ascontiguousarray(combining, dtype=numpy.int8).tobytes())
+    
+    return system
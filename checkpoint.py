@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+from copy import deepcopy
+from struct import Struct
+import os
+
+from binary import little_endian, extend_little_endian
+from bodies import System
+
+# A checkpoint holds everything gravity.main needs to carry on a render
+# from the last frame it drew: the simulation's System, the frame
+# numbers, the state of the random module and the partly drawn image of
+# each view. It's a small header followed by the raw arrays, all
+# little-endian:
+#
+# - HEADER
+# - RANDOM_STATE
+# - masses, displacements, velocities and radii (doubles) and combining
+#   flags (bytes) of count objects, dimensions components per vector
+# - for each image, IMAGE_HEADER and width * height * 3 bytes of RGB
+#   image data
+
+MAGIC = b"gravckpt"
+VERSION = 2
+
+                                   # field
+HEADER = Struct("<"                # (struct little-endian indicator)
+                "8s"               # MAGIC
+                "I"                # VERSION
+                "Q"                # frame, the simulation frame last drawn
+                "Q"                # drawn, the index of that frame among those drawn
+                "I"                # dimensions
+                "Q"                # count of objects
+                "I"                # count of images
+                )
+
+IMAGE_HEADER = Struct("<II") # width, height
+
+# random.getstate() is (3, 625 ints, gauss_next or None)
+RANDOM_STATE = Struct("<I625I?d")
+
+class Checkpoint(object):
+    """The state of a render after drawing a frame. system is a
+    bodies.System and images a list of the (width, height, RGB data) of
+    each view's image."""
+    
+    __slots__ = ("frame", "drawn", "system", "random_state", "images")
+    
+    def __init__(self, frame, drawn, system, random_state, images):
+        self.frame = frame
+        self.drawn = drawn
+        self.system = system
+        self.random_state = random_state
+        self.images = images
+
+def capture(objects):
+    """Returns a System copying a frame's objects, which stays valid when
+    the engine steps them again."""
+    
+    if isinstance(objects, System):
+        return deepcopy(objects)
+    else:
+        return System(objects)
+
+def write(file, checkpoint):
+    system = checkpoint.system
+    version, state, gauss_next = checkpoint.random_state
+    
+    file.write(HEADER.pack(MAGIC, VERSION, checkpoint.frame, checkpoint.drawn,
+                           system.dimensions, len(system), len(checkpoint.images)))
+    file.write(RANDOM_STATE.pack(version, *state, gauss_next is not None, gauss_next or 0.0))
+    
+    for values in (system.masses, system.displacements, system.velocities, system.radii, system.combining):
+        file.write(little_endian(values).tobytes())
+    
+    for width, height, data in checkpoint.images:
+        file.write(IMAGE_HEADER.pack(width, height))
+        file.write(data)
+
+def read(file):
+    magic, version, frame, drawn, dimensions, count, image_count = HEADER.unpack(file.read(HEADER.size))
+    
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a version {} checkpoint".format(VERSION))
+    
+    random_values = RANDOM_STATE.unpack(file.read(RANDOM_STATE.size))
+    random_state = (random_values[0], random_values[1:626],
+                    random_values[627] if random_values[626] else None)
+    
+    system = System(dimensions=dimensions)
+    
+    for values, length in [ (system.masses, count),
+                            (system.displacements, count * dimensions),
+                            (system.velocities, count * dimensions),
+                            (system.radii, count),
+                            (system.combining, count) ]:
+        extend_little_endian(values, file.read(length * values.itemsize))
+    
+    images = []
+    
+    for _ in range(image_count):
+        width, height = IMAGE_HEADER.unpack(file.read(IMAGE_HEADER.size))
+        data = file.read(width * height * 3)
+        
+        if len(data) != width * height * 3:
+            raise ValueError("checkpoint is truncated")
+        
+        images.append((width, height, data))
+    
+    return Checkpoint(frame, drawn, system, random_state, images)
+
+def save(filename, checkpoint):
+    """Writes a checkpoint to filename, replacing any earlier one only
+    once it's complete, so a crash while saving leaves the old one."""
+    
+    with open(filename + ".tmp", "wb") as file:
+        write(file, checkpoint)
+        file.flush()
+        os.fsync(file.fileno())
+    
+    os.replace(filename + ".tmp", filename)
+
+def load(filename):
+    with open(filename, "rb") as file:
+        return read(file)
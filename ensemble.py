@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+from copy import deepcopy
+import json
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from bodies import Object, System, numpy_system, numpy_views
+from gravity import numpy_combine
+import integrators
+import profiling
+
+# Stepping thousands of small systems one at a time costs more in Python
+# overhead than in arithmetic, so an Ensemble packs them into padded
+# (systems x bodies x dimensions) arrays which are all stepped at once.
+# Each system only feels its own bodies; slots past a system's last body
+# are padding, with no mass, which neither pull nor get pulled.
+
+class Ensemble(object):
+    """Many independent systems, in numpy arrays with a row per system:
+    masses, radii, combining and alive are (S, B) and displacements and
+    velocities (S, B, D), for S systems of up to B bodies of D dimensions.
+    
+    Each system's bodies come first in its row, in order; alive is false
+    for the padding after them."""
+    
+    __slots__ = ("masses", "displacements", "velocities", "radii", "combining", "alive")
+    
+    def __init__(self, masses, displacements, velocities, radii, combining, alive):
+        self.masses = masses
+        self.displacements = displacements
+        self.velocities = velocities
+        self.radii = radii
+        self.combining = combining
+        self.alive = alive
+    
+    @classmethod
+    def from_systems(cls, systems, dimensions=None):
+        """Packs an iterable of systems, each a System or a list of
+        Objects, into an Ensemble."""
+        
+        if numpy is None:
+            raise ImportError("ensembles require numpy")
+        
+        systems = [ s if isinstance(s, System) else System(s) for s in systems ]
+        
+        if dimensions is None:
+            dimensions = max([ s.dimensions for s in systems ] + [ 2 ])
+        
+        shape = (len(systems), max([ len(s) for s in systems ] + [ 1 ]))
+        ensemble = cls(numpy.zeros(shape), numpy.zeros(shape + (dimensions,)),
+                       numpy.zeros(shape + (dimensions,)), numpy.zeros(shape),
+                       numpy.zeros(shape, dtype=bool), numpy.zeros(shape, dtype=bool))
+        
+        for i, system in enumerate(systems):
+            if system.dimensions != dimensions:
+                system = System(list(system), dimensions)
+            
+            ensemble.set_system(i, *numpy_views(system))
+        
+        return ensemble
+    
+    def __len__(self):
+        return len(self.masses)
+    
+    @property
+    def counts(self):
+        """The number of bodies left in each system."""
+        
+        return self.alive.sum(axis=1)
+    
+    def set_system(self, i, masses, displacements, velocities, radii, combining):
+        """Replaces the i-th system's bodies with those in the given arrays."""
+        
+        n = len(masses)
+        
+        for field in self.__slots__:
+            getattr(self, field)[i] = 0
+        
+        self.masses[i, :n] = masses
+        self.displacements[i, :n] = displacements
+        self.velocities[i, :n] = velocities
+        self.radii[i, :n] = radii
+        self.combining[i, :n] = combining
+        self.alive[i, :n] = True
+    
+    def system_arrays(self, i):
+        """Returns copies of the i-th system's masses, displacements,
+        velocities, radii and combining flags, as numpy_combine() takes."""
+        
+        n = int(self.alive[i].sum())
+        
+        return (self.masses[i, :n].copy(), self.displacements[i, :n].copy(), self.velocities[i, :n].copy(),
+                self.radii[i, :n].copy(), self.combining[i, :n].copy())
+    
+    def system(self, i):
+        """Returns a System copying the i-th system."""
+        
+        return numpy_system(*self.system_arrays(i))
+    
+    def systems(self):
+        return [ self.system(i) for i in range(len(self)) ]
+
+def ensemble_accelerations(displacements, masses, G, block_size=1024):
+    """Returns the (S, B, D) accelerations of each body of each system
+    given their (S, B, D) displacements and (S, B) masses, ignoring pairs
+    closer than .5 like numpy_accelerations(). G may be a number or one
+    per system.
+    
+    Systems are handled block_size at a time so we don't need S * B * B *
+    D of temporary memory for big ensembles."""
+    
+    accelerations = numpy.zeros_like(displacements)
+    G = numpy.broadcast_to(numpy.asarray(G, dtype=float).reshape(-1, 1, 1), (len(masses), 1, 1))
+    
+    for start in range(0, len(displacements), block_size):
+        stop = start + block_size
+        block = displacements[start:stop]
+        
+        # separations[s, i, j] points from body i to body j of system s
+        separations = block[:, numpy.newaxis, :, :] - block[:, :, numpy.newaxis, :]
+        distances = numpy.sqrt(numpy.einsum("sijk,sijk->sij", separations, separations))
+        
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            factors = numpy.where(distances > .5, G[start:stop] * masses[start:stop, numpy.newaxis, :] / distances ** 3, 0)
+        
+        accelerations[start:stop] = numpy.einsum("sij,sijk->sik", factors, separations)
+    
+    return accelerations
+
+def colliding_systems(ensemble, block_size=1024):
+    """Returns the indices of the systems with any colliding bodies, found
+    for all systems at once, so only those need combining one at a time.
+    
+    Like ensemble_accelerations(), systems are checked block_size at a
+    time to bound the temporary memory needed."""
+    
+    candidates = ensemble.alive & ensemble.combining
+    
+    if not candidates.any():
+        return numpy.zeros(0, dtype=int)
+    
+    upper = numpy.triu(numpy.ones(candidates.shape[1:] * 2, dtype=bool), 1) # each pair once, not with itself
+    colliding = []
+    
+    for start in range(0, len(candidates), block_size):
+        stop = start + block_size
+        block = ensemble.displacements[start:stop]
+        block_candidates = candidates[start:stop]
+        
+        separations = block[:, numpy.newaxis, :, :] - block[:, :, numpy.newaxis, :]
+        distances = numpy.sqrt(numpy.einsum("sijk,sijk->sij", separations, separations))
+        
+        radii = ensemble.radii[start:stop]
+        touching = distances < numpy.minimum(radii[:, :, numpy.newaxis], radii[:, numpy.newaxis, :])
+        touching &= block_candidates[:, :, numpy.newaxis] & block_candidates[:, numpy.newaxis, :]
+        touching &= upper
+        
+        colliding.append(start + numpy.flatnonzero(touching.any(axis=(1, 2))))
+    
+    return numpy.concatenate(colliding)
+
+def simulate_ensemble(ensemble, time_step, G=6.67428e-11, history=False, integrator="euler",
+                      steps_per_frame=1, metrics=None):
+    """Yields an initial state and all following frames of every system
+    in an Ensemble, stepped in lockstep, like simulate_numpy().
+    
+    Each frame is the Ensemble itself, stepped in-place, or a copy of it
+    if history is true. G may be a number or a sequence with one per
+    system. Systems with colliding bodies have them combined with
+    numpy_combine(), exactly as the numpy engine would."""
+    
+    if numpy is None:
+        raise ImportError("ensembles require numpy")
+    
+    integrate = integrators.integrators[integrator]
+    metrics = metrics or profiling.Metrics()
+    ensemble = deepcopy(ensemble)
+    initial = None
+    
+    def accelerations(positions):
+        with metrics.timer("force"):
+            metrics.count("pairs", int((ensemble.counts * (ensemble.counts - 1) // 2).sum()))
+            
+            # padding slots have no mass so pull nothing, and are held still
+            return ensemble_accelerations(positions, ensemble.masses, G) * ensemble.alive[:, :, numpy.newaxis]
+    
+    yield deepcopy(ensemble) if history else ensemble
+    
+    while True:
+        for _ in range(steps_per_frame):
+            with metrics.timer("integrate"):
+                ensemble.displacements[:], ensemble.velocities[:], initial = integrate(
+                    ensemble.displacements, ensemble.velocities, accelerations, time_step, initial)
+            
+            with metrics.timer("merge"):
+                for i in colliding_systems(ensemble).tolist():
+                    before = int(ensemble.alive[i].sum())
+                    combined = numpy_combine(*ensemble.system_arrays(i))
+                    
+                    if len(combined[0]) != before:
+                        metrics.count("merges", before - len(combined[0]))
+                        ensemble.set_system(i, *combined)
+                        initial = None
+        
+        yield deepcopy(ensemble) if history else ensemble
+
+def main(in_filename="-", out_filename="-"):
+    """Steps an ensemble, given as a gravity.py-like input with a list of
+    "systems" of objects instead of "objects", and writes each system's
+    objects after the last frame as JSON in the same form."""
+    
+    in_file  = open(in_filename,  "rt") if in_filename  != "-" else sys.stdin
+    out_file = open(out_filename, "wt") if out_filename != "-" else sys.stdout
+    
+    input_defaults = { "comment": None,
+                       "G": 6.67428e-11,
+                       "dt": 60 * 60 * 24 * 365 * .25, # duration of the whole run in seconds
+                       "frames": 3001,
+                       "substeps": 1,
+                       "integrator": "euler",
+                       "systems": [] } # a list of lists of objects, as in gravity.py's "objects"
+    
+    with in_file, out_file:
+        input_dict = deepcopy(input_defaults)
+        input_dict.update(json.load(in_file))
+        
+        ensemble = Ensemble.from_systems([ [ Object.from_dict(d) for d in objects ]
+                                           for objects in input_dict["systems"] ])
+        frame_count = input_dict["frames"]
+        substeps = input_dict["substeps"]
+        time_step = input_dict["dt"] / ((frame_count - 1) or 1) / substeps
+        
+        frames = simulate_ensemble(ensemble, time_step, input_dict["G"],
+                                   integrator=input_dict["integrator"], steps_per_frame=substeps)
+        progress = profiling.Progress(frame_count)
+        
+        for f, ensemble in zip(range(frame_count), frames):
+            progress.update(f + 1, "{} systems, ".format(len(ensemble)))
+        
+        sys.stderr.write("\n")
+        
+        systems = [ [ { "m": o.mass, "d": list(o.displacement), "v": list(o.velocity),
+                        "radius": o.radius, "combining": o.combining } for o in system ]
+                    for system in ensemble.systems() ]
+        
+        json.dump({ "systems": systems }, out_file, indent=2)
+        out_file.write("\n")
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
@@ -1,109 +1,96 @@
 #!/usr/bin/env python3
-from copy import copy, deepcopy
+from copy import deepcopy
 import itertools
 import json
+import math
 import random
 import sys
 import time
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from bodies import Object, System, copy_objects, numpy_views, numpy_system
 from vector import Vector, V, sqrt
+import barnes_hut
+import checkpoint
+import inputs
+import integrators
+import profiling
 import raster
+import streaming
+import tiles
+import trajectory
 
-class Object(object):
-    """A non-elastic frictionless sphere in a vaccum, ha."""
+def spatial_hash(positions, cell_size):
+    """Returns a dict mapping grid cells (tuples of ints) to the indices
+    of the positions within them, for any number of dimensions.
+    
+    Anything closer than cell_size to a position is in its cell or one
+    of the cells neighbouring it; see neighbouring_cells()."""
     
-    def __init__(self, mass, displacement, velocity, radius=None, combining=True):
-        self.mass = mass
-        self.displacement = Vector(displacement)
-        self.velocity = Vector(velocity)
+    grid = {}
+    
+    for i, position in enumerate(positions):
+        if position is None: continue
         
-        if radius is None:
-            self.radius = 2 * sqrt(self.mass)
-        else:
-            self.radius = radius
-
-        self.combining = bool(combining)
+        cell = tuple(math.floor(c / cell_size) for c in position)
+        grid.setdefault(cell, []).append(i)
+    
+    return grid
 
-    from_dict_defaults = { "m": 1, "d": [ 0, 0 ], "v": [ 0, 0 ],
-                           "radius": None, "combining": True }
+def neighbouring_cells(position, cell_size):
+    """Yields the spatial_hash() cell containing a position and its 3 ** D - 1 neighbours."""
     
-    @classmethod
-    def from_dict(cls, source_dict):
-        input_dict = deepcopy(cls.from_dict_defaults)
-        input_dict.update(source_dict)
-        return cls(input_dict["m"], input_dict["d"], input_dict["v"], input_dict["radius"], input_dict["combining"])
+    cell = [ math.floor(c / cell_size) for c in position ]
+    
+    for offsets in itertools.product((-1, 0, 1), repeat=len(cell)):
+        yield tuple(c + o for c, o in zip(cell, offsets))
 
-    def __repr__(self):
-        return ("{.__name__}(mass={!r}, displacement={!r}, velocity={!r}, radius={!r}}, combining={!r})"
-                .format(type(self), self.mass, self.displacement, self.velocity, self.radius, self.combining))
+def combine_colliding(current):
+    """Combines colliding combining objects in a list of Objects, returning
+    the resulting list. The list is modified in-place.
 
-def simulate(current, time_step, G=6.67428e-11):
-    """Yields an initial state and all following frames."""
+    Each object absorbs every later object within the smaller of their
+    radii, in order, moving as it goes, so chains of merges in one step
+    end up as a single object. Only objects in nearby cells of a spatial
+    hash are tested; since an object which hasn't absorbed anything yet
+    can't be further away than its own radius, cells as large as the
+    largest radius are enough."""
     
-    yield current
+    radii = [ o.radius for o in current if o.combining ]
+    cell_size = max(radii) if radii else 0
     
-    while True:
-        current = deepcopy(current)
-        
-        for object, other in itertools.combinations(current, 2):
-            displacement = other.displacement - object.displacement
-            
-            if displacement.magnitude > .5:
-                force_magnitude = G * object.mass * other.mass / displacement.magnitude ** 2
-
-                # this is wrong. what I think it actually should be
-                # is something like...
-                # 
-                # F_y = sqrt(force_magnitude ** 2
-                #            / ((displacement[0] / displacement[1]) ** 2 + 1))
-                # F_x = (displacement[0] / displacement[1]) * F_y
-                #
-                # Determined from F_x^2 + F_y^2 = |F|^2
-                #             and F_x / F_y = delta_x / delta_y
-                # 
-                # See notebook 2010-Feb-14 note 2010-Feb-24#1.
-
-                if displacement[0] == 0:
-                    F_x = 0
-                    F_y = force_magnitude
-                elif displacement[1] == 0:
-                    F_y = 0
-                    F_x = force_magnitude
-                else:
-                    F_y = (force_magnitude ** 2
-                           / ((displacement[0] / displacement[1]) ** 2 + 1)) ** .5
-                    F_x = (displacement[0] / displacement[1]) * F_y
-                    
-                if displacement[0] > 0:
-                    F_x = +abs(F_x)
-                else:
-                    F_x = -abs(F_x)
-
-                if displacement[1] > 0:
-                    F_y = +abs(F_y)
-                else:
-                    F_y = -abs(F_y)
-                
-                force = V(F_x, F_y)
-                
-                object.velocity += force / object.mass * time_step
-                other.velocity  -= force / other.mass  * time_step
+    if not cell_size:
+        return current
+    
+    dimensions = max(len(o.displacement.components) for o in current)
+    
+    def position(object):
+        components = object.displacement.components
+        return components + [ 0 ] * (dimensions - len(components))
+    
+    grid = spatial_hash([ position(o) if o.combining else None for o in current ], cell_size)
+    
+    for i, object in enumerate(current):
+        if object is None or not object.combining: continue
         
-        for object in current:
-            object.displacement += object.velocity * time_step
+        last = i
         
-        # combing colliding combining objects
-        for i, object in enumerate(current):
-            if object is None or not object.combining: continue
+        while True:
+            candidates = sorted(j for cell in neighbouring_cells(position(object), cell_size)
+                                  for j in grid.get(cell, ())
+                                  if j > last and current[j] is not None)
             
-            for j, other in enumerate(current[i + 1:]):
-                if other is None or not other.combining: continue
-                
+            for j in candidates:
+                other = current[j]
                 displacement = other.displacement - object.displacement
                 
                 if displacement.magnitude < min(object.radius, other.radius):
                     object_portion = object.mass / (object.mass + other.mass)
-                    other_portion  = other.mass  / (other.mass + other.mass)
+                    other_portion  = other.mass  / (object.mass + other.mass)
                     
                     combined_object = Object(mass=object.mass + other.mass,
                                              displacement=object_portion * object.displacement + other_portion * other.displacement,
@@ -111,12 +98,439 @@ def simulate(current, time_step, G=6.67428e-11):
                                              radius=sqrt(object.radius ** 2 + other.radius ** 2))
                     
                     current[i] = object = combined_object
-                    current[i + 1 + j] = other = None
+                    current[j] = other = None
+                    
+                    # the combined object has moved, so look around again
+                    last = j
+                    break
+            else:
+                break
+    
+    if None in current:
+        current = [ o for o in current if o is not None ]
+    
+    return current
+
+def snapshot(current, history=False):
+    """Returns a frame of a simulation to yield from the list of Objects
+    it's stepping.
+
+    By default this is just a tuple of the live Objects, which cost
+    nothing to make but only stay valid until the next frame is
+    requested. If history is true it's a deep copy which callers may
+    keep around as long as they like."""
+    
+    if history:
+        return deepcopy(current)
+    else:
+        return tuple(current)
+
+def python_accelerations(positions, masses, G):
+    """Returns the gravitational accelerations, as 2D Vectors, of bodies at
+    the given positions, ignoring pairs closer than .5."""
+    
+    accelerations = [ V(0, 0) for _ in positions ]
+    
+    for i, j in itertools.combinations(range(len(positions)), 2):
+        displacement = positions[j] - positions[i]
+        
+        if displacement.magnitude > .5:
+            force_magnitude = G * masses[i] * masses[j] / displacement.magnitude ** 2
+
+            # this is wrong. what I think it actually should be
+            # is something like...
+            # 
+            # F_y = sqrt(force_magnitude ** 2
+            #            / ((displacement[0] / displacement[1]) ** 2 + 1))
+            # F_x = (displacement[0] / displacement[1]) * F_y
+            #
+            # Determined from F_x^2 + F_y^2 = |F|^2
+            #             and F_x / F_y = delta_x / delta_y
+            # 
+            # See notebook 2010-Feb-14 note 2010-Feb-24#1.
+
+            if displacement[0] == 0:
+                F_x = 0
+                F_y = force_magnitude
+            elif displacement[1] == 0:
+                F_y = 0
+                F_x = force_magnitude
+            else:
+                F_y = (force_magnitude ** 2
+                       / ((displacement[0] / displacement[1]) ** 2 + 1)) ** .5
+                F_x = (displacement[0] / displacement[1]) * F_y
+                
+            if displacement[0] > 0:
+                F_x = +abs(F_x)
+            else:
+                F_x = -abs(F_x)
+
+            if displacement[1] > 0:
+                F_y = +abs(F_y)
+            else:
+                F_y = -abs(F_y)
+            
+            force = V(F_x, F_y)
+            
+            accelerations[i] += force / masses[i]
+            accelerations[j] -= force / masses[j]
+    
+    return accelerations
+
+def step_objects(current, time_step, accelerations, integrator, initial=None, metrics=None):
+    """Advances a list of Objects in-place by one time_step with the given
+    integrator and then combines colliding objects.
+
+    accelerations takes positions and masses. Returns the new list of
+    Objects and the integrator's final accelerations, to be passed back
+    in as initial next time. Time spent is added to a profiling.Metrics,
+    if given."""
+    
+    metrics = metrics or profiling.Metrics()
+    masses = [ o.mass for o in current ]
+    
+    with metrics.timer("integrate"):
+        positions, velocities, initial = integrator([ o.displacement for o in current ],
+                                                    [ o.velocity for o in current ],
+                                                    lambda positions: accelerations(positions, masses),
+                                                    time_step, initial)
+        
+        for object, position, velocity in zip(current, positions, velocities):
+            object.displacement = position
+            object.velocity = velocity
+    
+    count = len(current)
+    
+    with metrics.timer("merge"):
+        current = combine_colliding(current)
+    
+    if len(current) != count:
+        metrics.count("merges", count - len(current))
+        initial = None # they belonged to objects which no longer exist
+    
+    return current, initial
+
+def simulate(current, time_step, G=6.67428e-11, history=False, integrator="euler",
+             steps_per_frame=1, metrics=None):
+    """Yields an initial state and all following frames.
+
+    The system is copied once and then stepped in-place; see snapshot()
+    for what history means for the frames yielded. integrator is a key
+    in integrators.integrators. Each frame is steps_per_frame steps of
+    time_step after the last. The time spent in each stage of a step
+    and the pairs of bodies evaluated are added to metrics, a
+    profiling.Metrics, if given."""
+    
+    integrate = integrators.integrators[integrator]
+    metrics = metrics or profiling.Metrics()
+    
+    def accelerations(positions, masses):
+        with metrics.timer("force"):
+            metrics.count("pairs", len(positions) * (len(positions) - 1) // 2)
+            return python_accelerations(positions, masses, G)
+    
+    current = copy_objects(current)
+    initial = None
+    
+    if any(len(o.displacement.components) > 2 for o in current):
+        raise ValueError("the python engine only simulates 2D systems; use the numpy or barnes-hut engine")
+    
+    yield snapshot(current, history)
+    
+    while True:
+        for _ in range(steps_per_frame):
+            current, initial = step_objects(current, time_step, accelerations, integrate, initial, metrics)
+        
+        yield snapshot(current, history)
+
+def numpy_accelerations(displacements, masses, G, block_size=256):
+    """Returns the (N, D) gravitational accelerations of bodies at the given
+    (N, D) displacements, ignoring pairs closer than .5 as simulate() does.
+
+    Rows are handled block_size at a time so we don't need N * N * D of
+    temporary memory for big systems."""
+    
+    accelerations = numpy.zeros_like(displacements)
+    
+    for start in range(0, len(displacements), block_size):
+        stop = start + block_size
+        
+        # separations[i, j] points from body start + i to body j
+        separations = displacements[numpy.newaxis, :, :] - displacements[start:stop, numpy.newaxis, :]
+        distances = numpy.sqrt((separations ** 2).sum(axis=-1))
+        
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            factors = numpy.where(distances > .5, G * masses / distances ** 3, 0)
         
-        if None in current:
-            current = [ o for o in current if o is not None ]
+        accelerations[start:stop] = numpy.einsum("ij,ijk->ik", factors, separations)
+    
+    return accelerations
+
+def numpy_combine(masses, displacements, velocities, radii, combining):
+    """Combines colliding combining objects held in arrays, returning the
+    (possibly shorter) arrays.
+
+    Merges happen in the same order as in simulate(): each object absorbs
+    every later object within the smaller of their radii, moving as it
+    goes. The objects with anything to absorb are found with a spatial
+    hash, like combine_colliding(); only those are then walked one at a
+    time."""
+    
+    n = len(masses)
+    cell_size = radii[combining].max() if combining.any() else 0
+    
+    if not cell_size:
+        return masses, displacements, velocities, radii, combining
+    
+    positions = displacements.tolist()
+    grid = spatial_hash([ p if c else None for p, c in zip(positions, combining.tolist()) ], cell_size)
+    absorbing = []
+    
+    for i in numpy.flatnonzero(combining).tolist():
+        candidates = [ j for cell in neighbouring_cells(positions[i], cell_size)
+                         for j in grid.get(cell, ()) if j > i ]
+        
+        if candidates:
+            distances = numpy.sqrt(((displacements[candidates] - displacements[i]) ** 2).sum(axis=-1))
+            
+            if (distances < numpy.minimum(radii[i], radii[candidates])).any():
+                absorbing.append(i)
+    
+    if not absorbing:
+        return masses, displacements, velocities, radii, combining
+    
+    alive = numpy.ones(n, dtype=bool)
+    
+    for i in absorbing:
+        if not alive[i]: continue
+        
+        j = i + 1
+        
+        while j < n:
+            distances = numpy.sqrt(((displacements[j:] - displacements[i]) ** 2).sum(axis=-1))
+            hits = numpy.flatnonzero((distances < numpy.minimum(radii[i], radii[j:]))
+                                     & alive[j:] & combining[j:])
+            
+            if not len(hits): break
+            
+            j += hits[0]
+            
+            object_portion = masses[i] / (masses[i] + masses[j])
+            other_portion  = masses[j] / (masses[i] + masses[j])
+            
+            displacements[i] = object_portion * displacements[i] + other_portion * displacements[j]
+            velocities[i] = object_portion * velocities[i] + other_portion * velocities[j]
+            radii[i] = sqrt(radii[i] ** 2 + radii[j] ** 2)
+            masses[i] += masses[j]
+            alive[j] = False
+            
+            j += 1
+    
+    return (masses[alive], displacements[alive], velocities[alive],
+            radii[alive], combining[alive])
+
+def simulate_numpy(current, time_step, G=6.67428e-11, history=False, integrator="euler",
+                   steps_per_frame=1, metrics=None):
+    """Yields an initial state and all following frames, like simulate().
+
+    The system is kept in a System and stepped through numpy_views() of
+    it with numpy_accelerations() and numpy_combine(). Each frame is the
+    System itself, which is only valid until the next frame is requested,
+    or a copy of it if history is true."""
+    
+    if numpy is None:
+        raise ImportError("the numpy engine requires numpy")
+    
+    integrate = integrators.integrators[integrator]
+    metrics = metrics or profiling.Metrics()
+    system = System(current)
+    initial = None
+    
+    def accelerations(positions, masses):
+        with metrics.timer("force"):
+            metrics.count("pairs", len(positions) * (len(positions) - 1) // 2)
+            return numpy_accelerations(positions, masses, G)
+    
+    yield deepcopy(system) if history else system
+    
+    while True:
+        for _ in range(steps_per_frame):
+            masses, displacements, velocities, radii, combining = numpy_views(system)
+            
+            with metrics.timer("integrate"):
+                displacements[:], velocities[:], initial = integrate(
+                    displacements, velocities, lambda positions: accelerations(positions, masses),
+                    time_step, initial)
+            
+            with metrics.timer("merge"):
+                combined = numpy_combine(masses, displacements, velocities, radii, combining)
+                
+                if len(combined[0]) != len(system):
+                    metrics.count("merges", len(system) - len(combined[0]))
+                    system = numpy_system(*combined)
+                    initial = None
         
-        yield current
+        yield deepcopy(system) if history else system
+
+def simulate_barnes_hut(current, time_step, G=6.67428e-11, theta=.5, history=False,
+                        integrator="euler", steps_per_frame=1, metrics=None):
+    """Yields an initial state and all following frames, like simulate(),
+    with accelerations approximated by a Barnes-Hut tree.
+
+    theta is the opening angle; see barnes_hut.accelerations(). The
+    "pairs" counted are the body-body and body-node interactions."""
+    
+    integrate = integrators.integrators[integrator]
+    metrics = metrics or profiling.Metrics()
+    
+    def accelerations(positions, masses):
+        with metrics.timer("force"):
+            positions = [ list(p) for p in positions ]
+            dimensions = max([ len(p) for p in positions ] + [ 2 ])
+            positions = [ p + [ 0 ] * (dimensions - len(p)) for p in positions ]
+            stats = {}
+            
+            results = barnes_hut.accelerations(positions, masses, G, theta, stats)
+            metrics.count("pairs", stats["interactions"])
+            
+            return [ Vector(a) for a in results ]
+    
+    current = copy_objects(current)
+    initial = None
+    
+    yield snapshot(current, history)
+    
+    while True:
+        for _ in range(steps_per_frame):
+            current, initial = step_objects(current, time_step, accelerations, integrate, initial, metrics)
+        
+        yield snapshot(current, history)
+
+def total_energy(objects, G=6.67428e-11, block_size=256):
+    """Returns the total kinetic and gravitational potential energy of a
+    system, ignoring pairs closer than .5 just like the engines do."""
+    
+    if numpy is not None:
+        masses, displacements, velocities, radii, combining = numpy_views(System(objects))
+        
+        energy = .5 * (masses * (velocities ** 2).sum(axis=-1)).sum()
+        indices = numpy.arange(len(masses))
+        
+        for start in range(0, len(masses), block_size):
+            stop = start + block_size
+            
+            separations = displacements[numpy.newaxis, :, :] - displacements[start:stop, numpy.newaxis, :]
+            distances = numpy.sqrt((separations ** 2).sum(axis=-1))
+            counted = (distances > .5) & (indices > indices[start:stop, numpy.newaxis])
+            
+            energy -= G * (numpy.outer(masses[start:stop], masses)[counted] / distances[counted]).sum()
+        
+        return float(energy)
+    
+    objects = list(objects)
+    energy = sum(.5 * o.mass * o.velocity.magnitude ** 2 for o in objects)
+    
+    for object, other in itertools.combinations(objects, 2):
+        distance = (other.displacement - object.displacement).magnitude
+        
+        if distance > .5:
+            energy -= G * object.mass * other.mass / distance
+    
+    return energy
+
+def total_momentum(objects):
+    """Returns the total momentum of a system as a Vector."""
+    
+    momentum = V(0, 0)
+    
+    for object in objects:
+        momentum += object.velocity * object.mass
+    
+    return momentum
+
+def drift_report(first, last, G=6.67428e-11):
+    """Returns a dict comparing the total energy and momentum of two frames
+    of the same system, to judge how well an integrator conserves them.
+
+    Momentum drift is given relative to the sum of the bodies' momentum
+    magnitudes, as a system's total momentum is often nearly zero."""
+    
+    first_energy, last_energy = total_energy(first, G), total_energy(last, G)
+    first_momentum, last_momentum = total_momentum(first), total_momentum(last)
+    momentum_scale = sum(o.mass * o.velocity.magnitude for o in first) or 1
+    
+    return { "initial energy": first_energy,
+             "final energy": last_energy,
+             "relative energy drift": ((last_energy - first_energy) / abs(first_energy)
+                                       if first_energy else last_energy - first_energy),
+             "initial momentum": list(first_momentum),
+             "final momentum": list(last_momentum),
+             "relative momentum drift": (last_momentum - first_momentum).magnitude / momentum_scale }
+
+engines = { "python": simulate,
+            "numpy": simulate_numpy,
+            "barnes-hut": simulate_barnes_hut }
+
+def project(objects, centre, zoom, offset):
+    """Returns the image positions and radii of the dots a frame's objects
+    are drawn as, ready to pass to Raster_24RGB.dots().
+
+    Systems and trajectory Frames are projected with numpy when it's available."""
+    
+    if numpy is not None and isinstance(objects, (System, trajectory.Frame)):
+        if isinstance(objects, System):
+            masses, displacements, velocities, radii, combining = numpy_views(objects)
+        else:
+            displacements, radii = objects.positions, objects.radii
+        
+        positions = ((displacements[:, :2] - numpy.array(list(centre)[:2], dtype=numpy.float64))
+                     * zoom + numpy.array(list(offset)[:2], dtype=numpy.float64))
+        
+        return positions, numpy.maximum(.5, radii * zoom)
+    
+    # only x and y of 3D systems, as above
+    positions = [ ((object.displacement - centre) * zoom + offset).components[:2] for object in objects ]
+    radii = [ max(.5, object.radius * zoom) for object in objects ]
+    
+    return positions, radii
+
+# the fully opaque part of mah_spectrum, from blue to red
+BODY_SPECTRUM = (1/6, 5/6)
+
+def body_values(objects, color_by):
+    """Returns the "speed" or "mass" of each of a frame's objects, to
+    color them by."""
+    
+    if color_by not in ("speed", "mass"):
+        raise ValueError("can only color by speed or mass, not {!r}".format(color_by))
+    
+    if numpy is not None and isinstance(objects, System):
+        masses, displacements, velocities, radii, combining = numpy_views(objects)
+        
+        # copies, as the engine will step the system on while we draw
+        return numpy.sqrt((velocities ** 2).sum(axis=-1)) if color_by == "speed" else masses.copy()
+    
+    return [ o.velocity.magnitude if color_by == "speed" else o.mass for o in objects ]
+
+def body_colors(values, low, high, resolution=1024):
+    """Returns an RGB color for each of values, spread across BODY_SPECTRUM
+    from low (blue) to high (red), using a lookup table of resolution
+    colors rather than working each out."""
+    
+    start, end = BODY_SPECTRUM
+    
+    if high > low:
+        scale = (end - start) / (high - low)
+        points = [ min(end, max(start, start + (value - low) * scale)) for value in values ]
+    else:
+        points = [ (start + end) / 2 ] * len(values)
+    
+    colors = raster.mah_spectrum.colors(points, resolution)
+    
+    if numpy is not None:
+        return colors[:, :3]
+    else:
+        return [ color[:3] for color in colors ]
 
 def starify_raster(raster, n=None):
     """Draws background-ish "stars" on a Raster image."""
@@ -137,9 +551,163 @@ def starify_raster(raster, n=None):
 
 raster.Raster.starify = starify_raster
 
-def main(in_filename="-", out_filename="-"):
-    in_file  = open(in_filename,  "rt") if in_filename  != "-" else sys.stdin
-    out_file = open(out_filename, "wb") if out_filename != "-" else sys.stdout.buffer
+class View(object):
+    """An image main draws every frame into, with its own view of the
+    system and its own output file (or files, if streaming).
+    
+    settings holds a value for each of View.keys; see main's input for
+    what they mean. If resuming, resumed_image is the (width, height,
+    data) of the image from the checkpoint and resumed_drawn the number
+    of frames it had drawn. Time spent and things drawn are added to a
+    profiling.Metrics."""
+    
+    keys = ("dimensions", "centre", "zoom", "stamps", "stream", "window", "fade",
+            "queue_size", "processes", "tile_size", "memory_map", "accumulate")
+    
+    def __init__(self, settings, out_filename, drawn_count, resumed_image=None, resumed_drawn=0,
+                 metrics=None):
+        self.stream = stream = settings["stream"]
+        self.memory_map = settings["memory_map"]
+        
+        if stream not in (None, "bmp", "rgb"):
+            raise ValueError("unknown stream format {!r}".format(stream))
+        
+        if self.memory_map and (stream or out_filename == "-"):
+            raise ValueError("memory_map needs an output filename and can't be used with stream")
+        
+        if settings["accumulate"] is not None and (self.memory_map or settings["processes"] is not None):
+            raise ValueError("accumulate can't be used with memory_map or processes")
+        
+        self.width, self.height = width, height = settings["dimensions"]
+        self.centre = Vector(settings["centre"])
+        self.zoom = settings["zoom"]
+        self.offset = V(width / 2 + .5, height / 2 + .5)
+        self.window = settings["window"]
+        self.fade = settings["fade"]
+        self.out_filename = out_filename
+        self.drawn_count = drawn_count
+        self.renderer = None
+        self.writer = None
+        self.metrics = metrics or profiling.Metrics()
+        
+        if resumed_image is not None and list(resumed_image[:2]) != [ width, height ]:
+            raise ValueError("checkpoint has a {}x{} image, not {}x{}"
+                             .format(resumed_image[0], resumed_image[1], width, height))
+        
+        if stream == "bmp" or self.memory_map:
+            self.out_file = None # we open one per image, or the image is the file, instead
+        elif stream == "rgb" and resumed_image is not None and out_filename != "-":
+            # carry on after the last window written before the checkpoint
+            self.out_file = open(out_filename, "r+b")
+            self.out_file.truncate(resumed_drawn // self.window * width * height * 3)
+            self.out_file.seek(0, 2)
+        else:
+            self.out_file = open(out_filename, "wb") if out_filename != "-" else sys.stdout.buffer
+        
+        self.stamps = raster.StampCache(**settings["stamps"]) if settings["stamps"] is not None else None
+        
+        if self.memory_map:
+            self.image = raster.Raster_BMP_24RGB(out_filename, width, height, fill=[0, 0, 0],
+                                                 pen=raster.PEN_MAX, stamps=self.stamps)
+        elif settings["accumulate"] is not None:
+            self.image = raster.Raster_Float_RGB(width, height, pen=raster.PEN_ADD, stamps=self.stamps,
+                                                 **settings["accumulate"])
+        else:
+            self.image = raster.Raster_24RGB(width, height, fill=[0, 0, 0], pen=raster.PEN_MAX,
+                                             stamps=self.stamps)
+        
+        if resumed_image is not None:
+            row_bytes = width * 3
+            
+            for y in range(height):
+                self.image.set_span(0, y, resumed_image[2][y * row_bytes:(y + 1) * row_bytes])
+        
+        if settings["processes"] is not None:
+            self.renderer = tiles.TiledRenderer(self.image, pen="max", tile_size=settings["tile_size"],
+                                                processes=settings["processes"] or None,
+                                                stamps=settings["stamps"])
+        
+        if stream:
+            self.writer = streaming.Consumer(self.write_streamed, settings["queue_size"])
+    
+    def project(self, objects):
+        with self.metrics.timer("project"):
+            return project(objects, self.centre, self.zoom, self.offset)
+    
+    def write_streamed(self, n_frame):
+        n, frame = n_frame
+        
+        with self.metrics.timer("write"):
+            if self.stream == "bmp":
+                with open(self.out_filename.format(n), "wb") as frame_file:
+                    frame.write_bmp(frame_file)
+            else:
+                self.out_file.write(frame.data)
+                self.out_file.flush()
+    
+    def draw(self, n, projection, color, opacity):
+        """Draws the n-th drawn frame, given as returned by project()."""
+        
+        dot_positions, dot_radii = projection
+        
+        with self.metrics.timer("render"):
+            if opacity:
+                touched = (self.renderer or self.image).dots(dot_positions, color, opacity, radius=dot_radii)
+                
+                self.metrics.count("dots", len(dot_positions))
+                self.metrics.count("pixels", touched or 0) # the renderer's are counted at the end
+            
+            if self.writer is not None and ((n + 1) % self.window == 0 or n + 1 == self.drawn_count):
+                if self.renderer is not None:
+                    self.renderer.sync()
+                
+                frame = self.image.copy()
+                self.image.fade(self.fade)
+                
+                if self.renderer is not None:
+                    self.renderer.load()
+            else:
+                frame = None
+        
+        if frame is not None:
+            self.writer.put((n // self.window, frame))
+    
+    def snapshot(self):
+        """Returns the (width, height, data) of the image, for a checkpoint."""
+        
+        with self.metrics.timer("checkpoint"):
+            if self.renderer is not None:
+                self.renderer.sync()
+            
+            return self.width, self.height, self.image.copy().data
+    
+    def finish(self):
+        """Writes the image, or waits for streamed images to be written."""
+        
+        if self.renderer is not None:
+            with self.metrics.timer("render"):
+                self.renderer.sync()
+            
+            self.metrics.count("pixels", self.renderer.touched)
+        
+        if self.writer is not None:
+            self.writer.close()
+        else:
+            with self.metrics.timer("write"):
+                if self.memory_map:
+                    self.image.close() # it's already in the file
+                else:
+                    self.image.write_bmp(self.out_file)
+    
+    def close(self):
+        if self.renderer is not None:
+            self.renderer.close()
+        
+        if self.out_file is not None:
+            self.out_file.close()
+
+def main(in_filename="-", out_filename="-", resume=False, overrides=None):
+    in_file  = open(in_filename,  "rb") if in_filename  != "-" else sys.stdin.buffer
     
     input_defaults = { "comment": None, # it's a comment, ignored
                        "dimensions": [ 1024, 1024 ], # size of output image, and unzoomed view area in metres
@@ -148,51 +716,288 @@ def main(in_filename="-", out_filename="-"):
                        "frames": 3001, # drawing "frames" to use
                        "objects": [], # objects in system we're rendering
                        "centre": [0, 0], # centre of view
-                       "zoom": 1e-9 } # factor of magnification
+                       "zoom": 1e-9, # factor of magnification
+                       "views": None, # list of views to draw instead of one, each a dict of View.keys and "out"
+                       "engine": "python", # key in engines used to simulate
+                       "engine_options": {}, # extra keyword arguments for the engine, eg. theta
+                       "integrator": "euler", # key in integrators.integrators used to step
+                       "substeps": 1, # simulation steps per drawing frame
+                       "draw_every": 1, # draw only every nth frame
+                       "stamps": None, # raster.StampCache arguments, eg. { "quantization": 8 }, to cache dots
+                       "stream": None, # "bmp" to write each window to out_filename.format(n), "rgb" for raw frames
+                       "window": 1, # drawn frames per streamed image
+                       "fade": 0, # factor images are faded by after being streamed, 0 to clear
+                       "queue_size": 4, # frames each stage of the pipeline may get ahead of the next
+                       "processes": None, # if set, draw in tiles across this many processes (0 for one per CPU)
+                       "tile_size": 256, # size in pixels of each tile drawn by a process
+                       "memory_map": False, # draw straight into out_filename as a bitmap, not in memory
+                       "accumulate": None, # add dots up as floats, eg. { "exposure": 2, "tone": "reinhard", "gamma": 2.2 }
+                       "checkpoint": None, # filename to save checkpoints to, and resume from
+                       "checkpoint_every": 100, # drawn frames between checkpoints
+                       "trajectory": None, # filename to record the frames drawn to, see trajectory.py
+                       "trajectory_itemsize": 8, # bytes per float recorded, 8 to replay exactly or 4
+                       "replay": None, # trajectory filename to draw instead of simulating objects
+                       "progress_interval": 1.0, # seconds between progress reports
+                       "metrics": None, # filename to write stage timings and counts to as JSON
+                       "color_by": None, # "speed" or "mass" to color each body by, instead of all by time
+                       "color_range": None, # [ low, high ] values to color by, or those of the first frame
+                       "drift_report": True } # whether to report energy/momentum drift at the end
     
-    with in_file, out_file:
-        start = time.time()
-        
+    start = time.time()
+    metrics = profiling.Metrics()
+    
+    with in_file, metrics.timer("load"):
         input_dict = deepcopy(input_defaults)
-        input_dict.update(json.load(in_file))
+        input_dict.update(inputs.read(in_file)) # JSON or columnar, see inputs.py
+        input_dict.update(overrides or {})
+    
+    # before any views open, and so truncate, their outputs
+    if input_dict["engine"] not in engines:
+        raise ValueError("unknown engine {!r}; expected one of {}".format(input_dict["engine"],
+                                                                          ", ".join(sorted(engines))))
+    
+    if input_dict["integrator"] not in integrators.integrators:
+        raise ValueError("unknown integrator {!r}; expected one of {}".format(
+            input_dict["integrator"], ", ".join(sorted(integrators.integrators))))
+    
+    if input_dict["engine"] == "python" and getattr(input_dict["objects"], "dimensions", 2) > 2:
+        raise ValueError("the python engine only simulates 2D systems; use the numpy or barnes-hut engine")
+    
+    # each view's settings default to those at the top level
+    if input_dict["views"] is None:
+        view_settings = [ ({ key: input_dict[key] for key in View.keys }, out_filename) ]
+    else:
+        view_settings = []
+        
+        for view in input_dict["views"]:
+            if "out" not in view:
+                raise ValueError("each view needs an \"out\" filename")
+            
+            settings = { key: input_dict[key] for key in View.keys }
+            settings.update((key, value) for key, value in view.items() if key != "out")
+            view_settings.append((settings, view["out"]))
+    
+    if any(settings["stream"] == "bmp" and view_filename == "-" for settings, view_filename in view_settings):
+        raise ValueError("streaming bitmaps needs an output filename to format with each one's number, not -")
+    
+    if input_dict["checkpoint"] is not None and any(settings["accumulate"] is not None
+                                                    for settings, _ in view_settings):
+        raise ValueError("checkpoints only hold 24-bit images, so can't be used with accumulate")
+    
+    resumed = None
+    
+    if resume:
+        if input_dict["checkpoint"] is None:
+            raise ValueError("can't resume without a checkpoint filename")
+        
+        sys.stderr.write("Loading checkpoint...\n")
+        resumed = checkpoint.load(input_dict["checkpoint"])
         
-        width, height = dimensions = input_dict["dimensions"]
-        offset = V(width / 2 + .5, height / 2 + .5)
+        if input_dict["trajectory"] is not None:
+            raise ValueError("can't resume recording a trajectory")
+        
+        if len(resumed.images) != len(view_settings):
+            raise ValueError("checkpoint has {} views, not {}".format(len(resumed.images), len(view_settings)))
+    
+    views = []
+    replay = None
+    
+    try:
+        if input_dict["replay"] is not None:
+            replay = trajectory.Reader(input_dict["replay"])
+            input_dict["frames"] = replay.metadata.get("frames", input_dict["frames"])
+            input_dict["drift_report"] = False # the velocities aren't recorded
         
         frame_count = input_dict["frames"]
-        time_step = input_dict["dt"] / ((frame_count - 1) or 1)
-        centre = Vector(input_dict["centre"])
-        zoom = input_dict["zoom"]
+        substeps = input_dict["substeps"]
+        draw_every = input_dict["draw_every"]
+        
+        # every draw_every-th frame is drawn, and the last frame always is
+        drawn = lambda f: f % draw_every == 0 or f == frame_count - 1
+        
+        if replay is not None:
+            drawn_count = sum(1 for f in replay.frame_numbers() if drawn(f))
+        else:
+            drawn_frames = list(range(0, frame_count, draw_every))
+            whole = len(drawn_frames) # those a whole draw_every frames after the last
+            
+            if frame_count and drawn_frames[-1] != frame_count - 1:
+                drawn_frames.append(frame_count - 1)
+            
+            drawn_count = len(drawn_frames)
+        
+        time_step = input_dict["dt"] / ((frame_count - 1) or 1) / substeps
         
         sys.stderr.write("Loading input system...\n")
-        system = [ Object.from_dict(d) for d in input_dict["objects"] ]
+        
+        with metrics.timer("load"):
+            system = input_dict["objects"]
+            
+            if not isinstance(system, System): # eg. given in overrides
+                system = inputs.system_from_dicts(system)
+        
+        # the first and last frames, for the drift report
+        ends = { "first": system, "last": system }
+        start_drawn = 0
+        
+        if resumed is not None:
+            sys.stderr.write("Resuming after frame {}...\n".format(resumed.frame))
+            system = resumed.system
+            ends["last"] = system
+            start_drawn = resumed.drawn + 1
+            random.setstate(resumed.random_state)
         
         sys.stderr.write("Instantiating image...\n")
-        image = raster.Raster_24RGB(width, height, fill=[0, 0, 0], pen=raster.PEN_MAX)
+        
+        for i, (settings, view_filename) in enumerate(view_settings):
+            views.append(View(settings, view_filename, drawn_count,
+                              resumed.images[i] if resumed is not None else None, start_drawn, metrics))
         
         #sys.stderr.write("Rendering background stars...\n")
         #image.starify()
         
-        frames = itertools.islice(simulate(system, time_step, G=input_dict["G"]), frame_count)
+        simulate_engine = engines[input_dict["engine"]]
         
-        for f, objects in enumerate(frames):
+        if replay is not None:
+            frames = itertools.islice(((frame.frame, frame) for frame in replay.frames()
+                                       if drawn(frame.frame)), start_drawn, None)
+        else:
+            def simulate(system, frames):
+                return simulate_engine(system, time_step, G=input_dict["G"], integrator=input_dict["integrator"],
+                                       steps_per_frame=substeps * frames, metrics=metrics,
+                                       **input_dict["engine_options"])
+            
+            def simulated_frames(current):
+                # a resumed engine's first frame is the one already drawn
+                skip = 1 if resumed is not None else 0
+                
+                if start_drawn < whole:
+                    for current in itertools.islice(simulate(current, draw_every), skip, whole - start_drawn + skip):
+                        yield current
+                
+                # and the last frame is however many frames after the one before
+                if drawn_count > whole and start_drawn < drawn_count:
+                    yield next(itertools.islice(simulate(current, (frame_count - 1) % draw_every), 1, None))
+            
+            frames = zip(drawn_frames[start_drawn:], simulated_frames(system))
+        
+        if input_dict["trajectory"] is not None:
+            recorder = trajectory.Recorder(input_dict["trajectory"],
+                                           system.dimensions,
+                                           input_dict["trajectory_itemsize"],
+                                           metadata={ "frames": frame_count,
+                                                      "draw_every": draw_every,
+                                                      "dt": input_dict["dt"],
+                                                      "G": input_dict["G"] })
+        else:
+            recorder = None
+        
+        checkpoint_every = input_dict["checkpoint_every"] if input_dict["checkpoint"] is not None else 0
+        color_by = input_dict["color_by"]
+        
+        if color_by is not None:
+            if replay is not None and color_by == "speed":
+                raise ValueError("trajectories don't record velocities, so can't be colored by speed")
+            
+            color_range = input_dict["color_range"]
+            
+            if color_range is None:
+                # of the first frame, even if we're resuming after it
+                first_values = body_values(next(replay.frames()) if replay is not None else ends["first"], color_by)
+                color_range = (min(first_values, default=0), max(first_values, default=0))
+        
+        def projected_frames():
+            # projecting is done by the simulating thread, as engines
+            # may modify the objects as soon as they're asked for more,
+            # and so is capturing their state for checkpoints
+            for n, (f, objects) in zip(itertools.count(start_drawn), frames):
+                if recorder is not None:
+                    with metrics.timer("write"):
+                        recorder.append(f, objects)
+                
+                if f == 0 and input_dict["drift_report"]:
+                    ends["first"] = checkpoint.capture(objects)
+                
+                ends["last"] = objects
+                
+                if checkpoint_every and (n + 1) % checkpoint_every == 0:
+                    with metrics.timer("checkpoint"):
+                        state = checkpoint.capture(objects)
+                else:
+                    state = None
+                
+                if color_by is not None:
+                    with metrics.timer("project"):
+                        values = body_values(objects, color_by)
+                else:
+                    values = None
+                
+                yield n, f, [ view.project(objects) for view in views ], values, state
+        
+        # checkpoints are saved in the background; if one's still being
+        # saved when the next is due, we wait for it
+        def save(saving):
+            with metrics.timer("checkpoint"):
+                checkpoint.save(input_dict["checkpoint"], saving)
+        
+        saver = streaming.Consumer(save, 1) if checkpoint_every else None
+        progress = profiling.Progress(drawn_count, start_drawn, input_dict["progress_interval"])
+        
+        for n, f, projections, values, state in streaming.buffered(projected_frames(), input_dict["queue_size"]):
             r, g, b, a = raster.mah_spectrum(f / (frame_count - 1) if frame_count > 1 else .5)
-            sys.stderr.write("Calculuated, rendering frame {}...\r".format(f))
-            sys.stderr.flush()
             
-            if a:
-                for object in objects:
-                    dot_position = (object.displacement - centre) * zoom + offset
-                    dot_radius = max(.5, object.radius * zoom)
-                    
-                    image.dot(dot_position, [r, g, b], a, radius=dot_radius)
+            # bodies are faded in and out over time either way
+            color = body_colors(values, *color_range) if values is not None else [r, g, b]
+            
+            for view, projection in zip(views, projections):
+                view.draw(n, projection, color, a)
+            
+            if state is not None:
+                saver.put(checkpoint.Checkpoint(f, n, state, random.getstate(),
+                                                [ view.snapshot() for view in views ]))
+            
+            progress.update(n + 1, "Rendered frame {}, ".format(f))
         
         sys.stderr.write("\n")
-        sys.stderr.write("Writing image to file...")
+        
+        if input_dict["drift_report"] and frame_count:
+            report = drift_report(ends["first"], ends["last"], input_dict["G"])
+            sys.stderr.write("Energy drift {:+.3e}, momentum drift {:.3e} (relative).\n"
+                             .format(report["relative energy drift"], report["relative momentum drift"]))
+        
+        for view in views:
+            if view.stamps is not None and view.renderer is None: # the processes' caches aren't counted
+                sys.stderr.write("Dot stamp cache hit rate {hit rate:.1%} ({hits} hits, {misses} misses).\n"
+                                 .format(**view.stamps.stats()))
+        
+        if saver is not None:
+            saver.close()
+        
+        if recorder is not None:
+            recorder.close()
+        
+        sys.stderr.write("Writing images to files...")
         sys.stderr.flush()
-        image.write_bmp(out_file)
+        
+        for view in views:
+            view.finish()
+        
         sys.stderr.write("Complete. Total clock time elasped has been {:.1f}.\n".format(time.time() - start))
+        sys.stderr.write(metrics.summary() + "\n")
+        
+        if input_dict["metrics"] is not None:
+            with open(input_dict["metrics"], "wt") as metrics_file:
+                json.dump(dict(metrics.report(), frames=drawn_count - start_drawn), metrics_file, indent=2)
+                metrics_file.write("\n")
+    finally:
+        for view in views:
+            view.close()
+        
+        if replay is not None:
+            replay.close()
     
 if __name__ == "__main__":
-    sys.exit(main(*sys.argv[1:]))
-
+    arguments = sys.argv[1:]
+    resume = "--resume" in arguments
+    
+    sys.exit(main(*[ a for a in arguments if a != "--resume" ], resume=resume))
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+from array import array
+from struct import Struct
+import json
+import re
+import sys
+
+from binary import padding, little_endian, extend_little_endian
+from bodies import System
+from vector import sqrt
+
+# gravity.py inputs can be loaded from two formats, told apart by their
+# first bytes:
+#
+# - JSON, as always. Its objects are parsed one at a time, straight into
+#   a System's arrays, so a big system never exists as a list of dicts or
+#   of Objects.
+# - columnar: HEADER, the rest of the input as JSON, then the System's
+#   masses, displacements, velocities and radii (doubles) and combining
+#   flags (bytes) of count objects, dimensions components per vector,
+#   each starting on a multiple of 8 bytes. Everything is little-endian.
+#   Loading one is just copying its arrays.
+#
+# Either way, the input's "objects" is loaded as a System.
+#
+#     ./inputs.py dust.json dust.columnar
+
+MAGIC = b"gravcols"
+VERSION = 1
+
+HEADER = Struct("<8sIQII") # MAGIC, VERSION, count, dimensions, JSON length
+
+def _widen(values, old, new):
+    """Returns flat vectors of old components padded to new components."""
+    
+    result = array("d", bytes(len(values) // old * new * 8))
+    
+    for k in range(old):
+        result[k::new] = values[k::old]
+    
+    return result
+
+def _append(system, source_dict):
+    """Appends an object given as a dict, as Object.from_dict() takes, to
+    a System without making an Object, widening the System's vectors if
+    it has more dimensions."""
+    
+    mass = source_dict.get("m", 1)
+    displacement = source_dict.get("d", [ 0, 0 ])
+    velocity = source_dict.get("v", [ 0, 0 ])
+    radius = source_dict.get("radius")
+    
+    dimensions = max(len(displacement), len(velocity))
+    
+    if dimensions > system.dimensions:
+        system.displacements = _widen(system.displacements, system.dimensions, dimensions)
+        system.velocities = _widen(system.velocities, system.dimensions, dimensions)
+        system.dimensions = dimensions
+    
+    padding = [ 0 ] * system.dimensions
+    
+    system.masses.append(mass)
+    system.displacements.extend(displacement + padding[len(displacement):])
+    system.velocities.extend(velocity + padding[len(velocity):])
+    system.radii.append(2 * sqrt(mass) if radius is None else radius)
+    system.combining.append(bool(source_dict.get("combining", True)))
+
+def system_from_dicts(dicts):
+    """Returns a System of objects given as dicts, as in an input."""
+    
+    system = System(dimensions=2)
+    
+    for source_dict in dicts:
+        _append(system, source_dict)
+    
+    return system
+
+def read_json(text):
+    """Parses an input, returning it as a dict with its "objects" as a
+    System. Each object is decoded and added to the System in turn."""
+    
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r"[ \t\n\r]*")
+    input_dict = { "objects": System(dimensions=2) }
+    
+    def skip(i):
+        return whitespace.match(text, i).end()
+    
+    def peek(i):
+        """Returns the next character after whitespace, or "" at the end."""
+        
+        return text[skip(i):skip(i) + 1]
+    
+    def expect(i, characters):
+        i = skip(i)
+        
+        if i >= len(text) or text[i] not in characters:
+            raise ValueError("expected {!r} at character {} of input".format(characters, i))
+        
+        return text[i], i + 1
+    
+    def decode(i):
+        i = skip(i)
+        
+        if i >= len(text):
+            raise ValueError("input ends unexpectedly at character {}".format(i))
+        
+        return decoder.raw_decode(text, i)
+    
+    def end(i):
+        if skip(i) != len(text):
+            raise ValueError("unexpected data after the input at character {}".format(skip(i)))
+        
+        return input_dict
+    
+    _, i = expect(0, "{")
+    
+    if peek(i) == "}":
+        return end(skip(i) + 1)
+    
+    while True:
+        start = skip(i)
+        key, i = decode(i)
+        
+        if not isinstance(key, str):
+            raise ValueError("expected a key at character {} of input".format(start))
+        
+        _, i = expect(i, ":")
+        
+        if key == "objects":
+            _, i = expect(i, "[")
+            
+            if peek(i) == "]":
+                i = skip(i) + 1
+            else:
+                while True:
+                    source_dict, i = decode(i)
+                    _append(input_dict["objects"], source_dict)
+                    
+                    separator, i = expect(i, ",]")
+                    
+                    if separator == "]":
+                        break
+        else:
+            input_dict[key], i = decode(i)
+        
+        separator, i = expect(i, ",}")
+        
+        if separator == "}":
+            return end(i)
+
+def read_columnar(data):
+    """Parses a columnar input from bytes, returning it like read_json()."""
+    
+    if len(data) < HEADER.size:
+        raise ValueError("columnar input is truncated")
+    
+    magic, version, count, dimensions, json_size = HEADER.unpack_from(data, 0)
+    
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a version {} columnar input".format(VERSION))
+    
+    offset = HEADER.size
+    input_dict = json.loads(bytes(data[offset:offset + json_size]).decode("utf-8"))
+    offset += json_size + len(padding(offset + json_size))
+    
+    system = input_dict["objects"] = System(dimensions=dimensions)
+    
+    for values, length in [ (system.masses, count),
+                            (system.displacements, count * dimensions),
+                            (system.velocities, count * dimensions),
+                            (system.radii, count),
+                            (system.combining, count) ]:
+        size = length * values.itemsize
+        
+        if offset + size > len(data):
+            raise ValueError("columnar input is truncated")
+        
+        extend_little_endian(values, data[offset:offset + size])
+        offset += size + len(padding(size))
+    
+    return input_dict
+
+def read(file):
+    """Reads an input in either format from a binary file."""
+    
+    data = file.read()
+    
+    if data[:len(MAGIC)] == MAGIC:
+        return read_columnar(memoryview(data))
+    else:
+        return read_json(data.decode("utf-8"))
+
+def write_columnar(file, input_dict):
+    """Writes an input whose "objects" is a System, or a list of Objects
+    or of dicts, in the columnar format."""
+    
+    system = input_dict.get("objects", [])
+    
+    if not isinstance(system, System):
+        if all(isinstance(o, dict) for o in system):
+            system = system_from_dicts(system)
+        else:
+            system = System(system)
+    
+    rest = json.dumps({ key: value for key, value in input_dict.items() if key != "objects" }).encode("utf-8")
+    
+    file.write(HEADER.pack(MAGIC, VERSION, len(system), system.dimensions, len(rest)))
+    file.write(rest + padding(HEADER.size + len(rest)))
+    
+    for values in (system.masses, system.displacements, system.velocities, system.radii, system.combining):
+        data = little_endian(values).tobytes()
+        file.write(data + padding(len(data)))
+
+def load(filename):
+    with open(filename, "rb") as file:
+        return read(file)
+
+def save(filename, input_dict):
+    with open(filename, "wb") as file:
+        write_columnar(file, input_dict)
+
+def main(in_filename="-", out_filename="-"):
+    """Converts an input, in either format, to the columnar format."""
+    
+    in_file  = open(in_filename,  "rb") if in_filename  != "-" else sys.stdin.buffer
+    out_file = open(out_filename, "wb") if out_filename != "-" else sys.stdout.buffer
+    
+    with in_file, out_file:
+        write_columnar(out_file, read(in_file))
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
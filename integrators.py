@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+import warnings
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Integrators advance a system's positions and velocities by one time
+# step. They all take the same arguments:
+#
+# - positions and velocities, either lists of Vectors or (N, D) numpy
+#   arrays, which are never modified
+# - accelerations, a function taking positions and returning the
+#   accelerations at them in the same form
+# - time_step
+# - initial, the accelerations at the given positions if the caller
+#   already knows them, or None
+#
+# and return new (positions, velocities, final), where final is the
+# accelerations at the new positions if they were calculated along the
+# way, or None. Passing it back in as the next step's initial saves a
+# force evaluation per step.
+
+def axpy(xs, ys, scale):
+    """Returns xs + ys * scale for lists of Vectors or numpy arrays."""
+    
+    if numpy is not None and isinstance(xs, numpy.ndarray):
+        return xs + ys * scale
+    else:
+        return [ x + y * scale for x, y in zip(xs, ys) ]
+
+def max_relative_change(olds, news):
+    """Returns the largest |new - old| / |old| of corresponding vectors."""
+    
+    if numpy is not None and isinstance(olds, numpy.ndarray):
+        old_magnitudes = numpy.sqrt((olds ** 2).sum(axis=-1))
+        changes = numpy.sqrt(((news - olds) ** 2).sum(axis=-1))
+        nonzero = old_magnitudes > 0
+        
+        return float((changes[nonzero] / old_magnitudes[nonzero]).max()) if nonzero.any() else 0.0
+    else:
+        return max([ (new - old).magnitude / old.magnitude
+                     for old, new in zip(olds, news) if old ] + [ 0.0 ])
+
+def euler(positions, velocities, accelerations, time_step, initial=None):
+    """Semi-implicit Euler: kick the velocities, then drift the positions
+    with the new velocities. First order; one force evaluation."""
+    
+    if initial is None:
+        initial = accelerations(positions)
+    
+    velocities = axpy(velocities, initial, time_step)
+    positions = axpy(positions, velocities, time_step)
+    
+    return positions, velocities, None
+
+def leapfrog(positions, velocities, accelerations, time_step, initial=None):
+    """Kick-drift-kick leapfrog, aka. velocity Verlet. Second order and
+    symplectic, so energy doesn't drift away over long runs; one force
+    evaluation per step if final is passed on as initial."""
+    
+    if initial is None:
+        initial = accelerations(positions)
+    
+    velocities = axpy(velocities, initial, time_step / 2)
+    positions = axpy(positions, velocities, time_step)
+    
+    final = accelerations(positions)
+    velocities = axpy(velocities, final, time_step / 2)
+    
+    return positions, velocities, final
+
+def rk4(positions, velocities, accelerations, time_step, initial=None):
+    """Classic fourth-order Runge-Kutta. Four force evaluations per step."""
+    
+    h = time_step
+    
+    k1_v = initial if initial is not None else accelerations(positions)
+    k1_x = velocities
+    
+    k2_x = axpy(velocities, k1_v, h / 2)
+    k2_v = accelerations(axpy(positions, k1_x, h / 2))
+    
+    k3_x = axpy(velocities, k2_v, h / 2)
+    k3_v = accelerations(axpy(positions, k2_x, h / 2))
+    
+    k4_x = axpy(velocities, k3_v, h)
+    k4_v = accelerations(axpy(positions, k3_x, h))
+    
+    dx = axpy(axpy(axpy(k1_x, k2_x, 2), k3_x, 2), k4_x, 1)
+    dv = axpy(axpy(axpy(k1_v, k2_v, 2), k3_v, 2), k4_v, 1)
+    
+    return axpy(positions, dx, h / 6), axpy(velocities, dv, h / 6), None
+
+def adaptive(positions, velocities, accelerations, time_step, initial=None,
+             tolerance=.01, max_subdivisions=4096, max_evaluations=64):
+    """Leapfrog with the step subdivided wherever accelerations change
+    quickly, ie. during close encounters.
+    
+    A substep is retried at half the size whenever any body's acceleration
+    changes by more than tolerance (relative) across it, down to
+    time_step / max_subdivisions, and substeps grow again once things
+    calm down. Quiet steps cost a single force evaluation.
+    
+    The substep is the same for every body, so one close pair slows the
+    whole system down; to keep that bounded, once max_evaluations force
+    evaluations have gone into a step the rest of it is taken in one
+    substep, with a RuntimeWarning."""
+    
+    evaluations = 0
+    
+    if initial is None:
+        initial = accelerations(positions)
+        evaluations += 1
+    
+    elapsed = 0.0
+    substep = time_step
+    smallest = time_step / max_subdivisions
+    gave_up = False
+    
+    while time_step - elapsed > time_step * 1e-12:
+        if evaluations >= max_evaluations and not gave_up:
+            gave_up = True
+            warnings.warn("adaptive step gave up subdividing after {} force evaluations"
+                          .format(evaluations), RuntimeWarning)
+        
+        substep = time_step - elapsed if gave_up else min(substep, time_step - elapsed)
+        
+        new_positions, new_velocities, final = leapfrog(positions, velocities, accelerations,
+                                                        substep, initial)
+        evaluations += 1
+        change = max_relative_change(initial, final)
+        
+        if change > tolerance and substep / 2 >= smallest and not gave_up:
+            substep /= 2
+            continue
+        
+        positions, velocities, initial = new_positions, new_velocities, final
+        elapsed += substep
+        
+        if change < tolerance / 4:
+            substep *= 2
+    
+    return positions, velocities, initial
+
+integrators = { "euler": euler,
+                "leapfrog": leapfrog,
+                "verlet": leapfrog,
+                "rk4": rk4,
+                "adaptive": adaptive }
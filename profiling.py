@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+from collections import defaultdict
+from contextlib import contextmanager
+import sys
+import threading
+import time
+
+# The stages of a render run on several threads at once (simulating,
+# drawing, writing), so their times add up to more than the wall time;
+# they say where each thread's time goes, and so what's worth speeding up.
+
+class Metrics(object):
+    """Per-stage timers and counters, safe to update from any thread.
+    
+    Timers are exclusive: time spent in a stage timed within another
+    (eg. force within integrate) only counts towards the inner one."""
+    
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.perf_counter()
+    
+    @contextmanager
+    def timer(self, stage):
+        stack = self.local.__dict__.setdefault("stack", [])
+        stack.append(0.0) # time spent in stages within this one
+        start = time.perf_counter()
+        
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            inner = stack.pop()
+            
+            if stack:
+                stack[-1] += elapsed
+            
+            with self.lock:
+                self.times[stage] += elapsed - inner
+    
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] += n
+    
+    def report(self):
+        with self.lock:
+            return { "wall seconds": time.perf_counter() - self.started,
+                     "stage seconds": dict(self.times),
+                     "counts": dict(self.counts) }
+    
+    def summary(self):
+        """Returns a line listing the time in each stage, longest first."""
+        
+        with self.lock:
+            stages = sorted(self.times.items(), key=lambda item: -item[1])
+        
+        return "Time in stages: " + ", ".join("{} {:.2f}s".format(stage, seconds)
+                                              for stage, seconds in stages)
+
+class Progress(object):
+    """Writes how far through total frames we are, how fast we're going
+    and when we should be done, at most every interval seconds so that
+    writing it doesn't slow us down."""
+    
+    def __init__(self, total, done=0, interval=1.0, file=None):
+        self.total = total
+        self.first = done
+        self.interval = interval
+        self.file = file or sys.stderr
+        self.started = self.written = time.perf_counter()
+    
+    def update(self, done, label=""):
+        now = time.perf_counter()
+        
+        if now - self.written < self.interval and done < self.total:
+            return
+        
+        self.written = now
+        rate = (done - self.first) / (now - self.started) if now > self.started else 0
+        
+        if rate and done < self.total:
+            eta = " ETA {}".format(format_seconds((self.total - done) / rate))
+        else:
+            eta = ""
+        
+        self.file.write("{}{}/{} frames, {:.1f} frames/s{}    \r".format(label, done, self.total, rate, eta))
+        self.file.flush()
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    
+    return "{}:{:02}:{:02}".format(hours, minutes, seconds)
@@ -26,8 +26,18 @@ except ImportError:
         __setitem__ = lambda self, key, value: self.set_item(key, value)
         __call__    = lambda self, *a, **kw: self.call(*a, **kw)
 
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from copy import copy
 from struct import Struct
 import math
+import mmap
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # Pens are applied on a per-channel basis.
 PEN_REPLACE = lambda old, new: new
@@ -37,13 +47,154 @@ PEN_MAX     = lambda old, new: max(old, new)
 PEN_DIFF    = lambda old, new: abs(old - new)
 PEN_XOR     = lambda old, new: old ^ new
 
+# Pens which give the same result whatever order overlapping dots are
+# drawn in can be applied to many dots at once, by Raster_24RGB.dots().
+if numpy is not None:
+    NUMPY_PENS = { PEN_ADD: numpy.add,
+                   PEN_MIN: numpy.minimum,
+                   PEN_MAX: numpy.maximum }
+else:
+    NUMPY_PENS = {}
+
+def dot_stamp(radius, x_frac, y_frac):
+    """Returns the anti-aliased coverage of a dot of the given radius at a
+    sub-pixel offset, as (x_offsets, y_offsets, coverages) of the pixels
+    it touches. They're numpy arrays if numpy is available."""
+    
+    offsets = range(math.floor(-radius) - 1,
+                    math.ceil ( radius) + 2)
+    
+    x_offsets, y_offsets, coverages = [], [], []
+    
+    for x_o in offsets:
+        for y_o in offsets:
+            distance = math.sqrt((x_o - x_frac) ** 2 +
+                                 (y_o - y_frac) ** 2)
+            
+            if distance <= radius - .5:
+                coverage = 1.0
+            elif distance < radius + .5:
+                coverage = radius - distance + .5
+            else:
+                continue
+            
+            x_offsets.append(x_o)
+            y_offsets.append(y_o)
+            coverages.append(coverage)
+    
+    if numpy is not None:
+        return (numpy.array(x_offsets, dtype=numpy.int64),
+                numpy.array(y_offsets, dtype=numpy.int64),
+                numpy.array(coverages, dtype=numpy.float64))
+    else:
+        return x_offsets, y_offsets, coverages
+
+class StampCache(object):
+    """A least-recently-used cache of dot_stamp()s.
+    
+    Dot positions and radii are rounded to 1 / quantization of a pixel,
+    so most dots can reuse an existing stamp; a coarser quantization gets
+    more hits but puts dots slightly out of place. hits and misses are
+    counted so the quantization can be tuned."""
+    
+    def __init__(self, size=4096, quantization=8):
+        self.size = size
+        self.quantization = quantization
+        self.stamps = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def lookup(self, x, y, radius):
+        """Returns (x_int, y_int, stamp) for a dot at x, y: the stamp's
+        offsets are relative to the pixel (x_int, y_int)."""
+        
+        q = self.quantization
+        
+        x_int, x_frac = divmod(round(x * q), q)
+        y_int, y_frac = divmod(round(y * q), q)
+        
+        return x_int, y_int, self._stamp((max(1, round(radius * q)), x_frac, y_frac))
+    
+    def _stamp(self, key):
+        """Returns the stamp for a (quantized radius, x_frac, y_frac) key,
+        making it if it isn't cached."""
+        
+        stamp = self.stamps.get(key)
+        
+        if stamp is None:
+            self.misses += 1
+            
+            q = self.quantization
+            stamp = self.stamps[key] = dot_stamp(key[0] / q, key[1] / q, key[2] / q)
+            
+            if len(self.stamps) > self.size:
+                self.stamps.popitem(last=False)
+        else:
+            self.hits += 1
+            self.stamps.move_to_end(key)
+        
+        return stamp
+    
+    def coverages(self, coordinates, radii):
+        """Returns the index of the dot, x, y and coverage of each pixel
+        touched by dots at (N, 2) coordinates with (N,) radii, like
+        Raster_24RGB._coverages(), from stamps. Needs numpy.
+        
+        Each distinct stamp the dots need is looked up once, then they're
+        all copied into place together by indexing."""
+        
+        q = self.quantization
+        
+        quantized = numpy.rint(coordinates * q).astype(numpy.int64)
+        x_int, x_frac = numpy.divmod(quantized[:, 0], q)
+        y_int, y_frac = numpy.divmod(quantized[:, 1], q)
+        quantized_radii = numpy.maximum(1, numpy.rint(radii * q)).astype(numpy.int64)
+        
+        # each dot's key as one number, so finding the distinct ones is quick
+        keys, inverse = numpy.unique((quantized_radii * q + x_frac) * q + y_frac, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        
+        stamps = [ self._stamp((key // (q * q), key // q % q, key % q)) for key in keys.tolist() ]
+        
+        # a lookup counts as a hit for every dot sharing a stamp but the first
+        self.hits += len(coordinates) - len(keys)
+        
+        # all the stamps end to end, and where each one starts
+        lengths = numpy.array([ len(stamp[0]) for stamp in stamps ], dtype=numpy.int64)
+        starts = numpy.concatenate([ [ 0 ], numpy.cumsum(lengths)[:-1] ])
+        x_offsets, y_offsets, coverages = (numpy.concatenate(arrays) for arrays in zip(*stamps))
+        
+        dot_lengths = lengths[inverse]
+        dot_indices = numpy.repeat(numpy.arange(len(coordinates)), dot_lengths)
+        
+        # the index into the stamps of each pixel: its dot's stamp's start,
+        # plus how far it is into its dot's pixels
+        dot_starts = numpy.cumsum(dot_lengths) - dot_lengths
+        pixels = starts[inverse][dot_indices] + numpy.arange(len(dot_indices)) - dot_starts[dot_indices]
+        
+        return (dot_indices, x_offsets[pixels] + x_int[dot_indices], y_offsets[pixels] + y_int[dot_indices],
+                coverages[pixels])
+    
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+    
+    def stats(self):
+        return { "hits": self.hits,
+                 "misses": self.misses,
+                 "hit rate": self.hit_rate,
+                 "stamps": len(self.stamps),
+                 "size": self.size,
+                 "quantization": self.quantization }
+
 class Raster(Object):
     color_fmt = Struct("B")
     default_fill = [ 0 ]
     
     default_pen = staticmethod(PEN_REPLACE)
     
-    def initialize(self, width, height, fill=None, pen=None):
+    def initialize(self, width, height, fill=None, pen=None, stamps=None):
         if fill is None:
             fill = self.default_fill
         
@@ -52,6 +203,7 @@ class Raster(Object):
         self.data = (width * height *
                      bytearray(self.color_fmt.pack(*fill)))
         self.pen = pen or self.default_pen
+        self.stamps = stamps # a StampCache, if dots should use one
     
     def get_item(self, x_y):
         x, y = x_y
@@ -74,9 +226,46 @@ class Raster(Object):
         i = (y * self.width + x) * self.color_fmt.size
         
         self.data[i:i + self.color_fmt.size] = self.color_fmt.pack(*color)
+    
+    def get_span(self, x, y, count):
+        """Returns the data of count pixels of row y, starting at x."""
+        
+        i = (y * self.width + x) * self.color_fmt.size
+        
+        return self.data[i:i + count * self.color_fmt.size]
+    
+    def set_span(self, x, y, data):
+        """Replaces pixels of row y, starting at x, with data as returned
+        by get_span()."""
+        
+        i = (y * self.width + x) * self.color_fmt.size
+        
+        self.data[i:i + len(data)] = data
 
+    def copy(self):
+        """Returns a copy of the image which doesn't share its data."""
+        
+        result = copy(self)
+        result.data = bytearray(self.data)
+        return result
+    
+    def fade(self, factor):
+        """Multiplies every channel of every pixel by factor (0 to 1)."""
+        
+        table = bytes(int(i * factor) for i in range(256))
+        self.data[:] = self.data.translate(table)
+    
+    def pixels(self):
+        """Returns a (height, width, channels) numpy array of unsigned bytes
+        sharing our data, so that changes to it change the image."""
+        
+        return numpy.frombuffer(self.data, dtype=numpy.uint8).reshape(
+            self.height, self.width, self.color_fmt.size)
+    
     def dot(self, coordinates, color, opacity=1, pen=None, radius=.5):
-        """Draws a dot/circle of the chosen radius. Default, .5, is just a point."""
+        """Draws a dot/circle of the chosen radius. Default, .5, is just a point.
+        
+        Returns the number of pixels drawn to."""
         
         pen = pen or self.pen
         x, y = coordinates
@@ -85,28 +274,23 @@ class Raster(Object):
             x - radius - 1 > self.width or
             y + radius + 1 < 0 or
             y - radius - 1 > self.height):
-            return # out of bounds
+            return 0 # out of bounds
         
-        offsets = range(math.floor(-radius) - 1,
-                        math.ceil ( radius) + 2)
-
-        offset_error = radius - (math.floor(-radius) - 1)
-        
-        x_int, x_frac = divmod(x, 1)
-        y_int, y_frac = divmod(y, 1)
-        
-        for x_o in offsets:
-            for y_o in offsets:
-                distance = math.sqrt((x_o - x_frac) ** 2 +
-                                     (y_o - y_frac) ** 2)
-                
-                if distance <= radius - .5:
-                    self.point((x_int + x_o,
-                                y_int + y_o), color, opacity, pen)
-                elif distance < radius + .5:
-                    self.point((x_int + x_o,
-                                y_int + y_o), color, (opacity
-                                                      * (radius - distance + .5)), pen)
+        if self.stamps is not None:
+            x_int, y_int, stamp = self.stamps.lookup(x, y, radius)
+        else:
+            x_int, x_frac = divmod(x, 1)
+            y_int, y_frac = divmod(y, 1)
+            
+            stamp = dot_stamp(radius, x_frac, y_frac)
+        
+        touched = 0
+        
+        for x_o, y_o, coverage in zip(*stamp):
+            touched += self.point((x_int + x_o,
+                                   y_int + y_o), color, opacity * coverage, pen)
+        
+        return touched
     
                               # type # value # description
                               # ---- # ----- # -----------
@@ -154,7 +338,7 @@ class Raster_24RGB(Raster):
         previous = self[coordinates]
         
         if previous is None:
-            return # OOB
+            return False # OOB
         
         # colors may be given as floats (0 to 1)
         # or as integers (0 to 255)
@@ -172,9 +356,146 @@ class Raster_24RGB(Raster):
         self[coordinates] = [ int(pen(current, old))
                               for current, old
                               in zip(color, previous) ]
+        
+        return True
     
-    def write_bmp(self, file, offset=0):
-        row_bytes = self.width * 3
+    def dots(self, coordinates, color, opacity=1, pen=None, radius=.5):
+        """Draws many dots at once, as if dot() were called for each.
+        
+        coordinates is a sequence of (x, y) pairs; color, opacity and
+        radius may each be given once for all dots or once per dot. With
+        numpy and a pen from NUMPY_PENS every dot's anti-aliased coverage
+        is calculated in a few array operations and blended into our
+        pixels() together; otherwise it falls back to dot().
+        
+        Returns the number of pixels drawn to, counting each dot's
+        separately."""
+        
+        pen = pen or self.pen
+        ufunc = NUMPY_PENS.get(pen)
+        
+        if ufunc is None:
+            count = len(coordinates)
+            
+            colors = color if hasattr(color[0], "__len__") else [ color ] * count
+            opacities = opacity if hasattr(opacity, "__len__") else [ opacity ] * count
+            radii = radius if hasattr(radius, "__len__") else [ radius ] * count
+            
+            return sum(self.dot(*dot) for dot in zip(coordinates, colors, opacities, [ pen ] * count, radii))
+        
+        coordinates = numpy.asarray(coordinates, dtype=numpy.float64).reshape(-1, 2)
+        count = len(coordinates)
+        
+        if not count:
+            return 0
+        
+        colors = numpy.asarray(color)
+        
+        # colors may be given as floats (0 to 1)
+        # or as integers (0 to 255)
+        if colors.dtype.kind == "f":
+            colors = colors * 255
+        
+        colors = numpy.broadcast_to(colors.astype(numpy.float64), (count, 3))
+        opacities = numpy.broadcast_to(numpy.asarray(opacity, dtype=numpy.float64), (count,))
+        radii = numpy.broadcast_to(numpy.asarray(radius, dtype=numpy.float64), (count,))
+        
+        if self.stamps is not None:
+            dot_indices, x, y, coverages = self._stamped_coverages(coordinates, radii)
+        else:
+            dot_indices, x, y, coverages = self._coverages(coordinates, radii)
+        
+        drawn = (0 <= x) & (x < self.width) & (0 <= y) & (y < self.height)
+        dot_indices = dot_indices[drawn]
+        
+        x = x[drawn].astype(numpy.int64)
+        y = y[drawn].astype(numpy.int64)
+        values = numpy.clip((colors[dot_indices] * (opacities[dot_indices] * coverages[drawn])[:, numpy.newaxis])
+                            .astype(numpy.int64), 0, 255)
+        
+        # indexed by row and column, as rows needn't be contiguous
+        pixels = self.pixels()
+        
+        if ufunc is numpy.add:
+            # sum overlapping dots first so we only clip once
+            unique_indices, inverse = numpy.unique(y * self.width + x, return_inverse=True)
+            y, x = numpy.divmod(unique_indices, self.width)
+            
+            for channel in range(3):
+                totals = numpy.bincount(inverse, weights=values[:, channel])
+                pixels[y, x, channel] = numpy.clip(pixels[y, x, channel] + totals, 0, 255)
+        else:
+            for channel in range(3):
+                ufunc.at(pixels[:, :, channel], (y, x), values[:, channel].astype(numpy.uint8))
+        
+        return len(values)
+    
+    def _coverages(self, coordinates, radii):
+        """Returns the index of the dot, x, y and coverage of each pixel
+        touched by the given dots, as flat numpy arrays."""
+        
+        x_int, x_frac = numpy.divmod(coordinates[:, 0], 1)
+        y_int, y_frac = numpy.divmod(coordinates[:, 1], 1)
+        
+        # same offsets as dot_stamp() uses, one window of them per dot
+        lows = numpy.floor(-radii) - 1
+        sizes = (numpy.ceil(radii) + 2 - lows).astype(numpy.int64)
+        
+        results = []
+        
+        # dots with the same window size are done together
+        for size in numpy.unique(sizes):
+            selected = numpy.flatnonzero(sizes == size)
+            offsets = lows[selected, numpy.newaxis] + numpy.arange(size)
+            
+            x_o = offsets[:, :, numpy.newaxis]
+            y_o = offsets[:, numpy.newaxis, :]
+            r = radii[selected, numpy.newaxis, numpy.newaxis]
+            
+            distances = numpy.sqrt((x_o - x_frac[selected, numpy.newaxis, numpy.newaxis]) ** 2 +
+                                   (y_o - y_frac[selected, numpy.newaxis, numpy.newaxis]) ** 2)
+            coverages = numpy.where(distances <= r - .5, 1.0, r - distances + .5)
+            
+            x, y = numpy.broadcast_arrays(x_int[selected, numpy.newaxis, numpy.newaxis] + x_o,
+                                          y_int[selected, numpy.newaxis, numpy.newaxis] + y_o)
+            
+            touched = distances < r + .5
+            dot_indices, _, _ = numpy.nonzero(touched)
+            
+            results.append((selected[dot_indices], x[touched], y[touched], coverages[touched]))
+        
+        return tuple(numpy.concatenate(arrays) for arrays in zip(*results))
+    
+    def _stamped_coverages(self, coordinates, radii):
+        """Like _coverages(), but using stamps from our StampCache."""
+        
+        return self.stamps.coverages(coordinates, radii)
+    
+    def bgr_data(self, alpha=None):
+        """Returns our data with each pixel's channels in BGR order, as
+        bitmaps want them, or as BGRA with the given alpha byte value."""
+        
+        pixels = self.width * self.height
+        channels = 3 if alpha is None else 4
+        result = bytearray(pixels * channels)
+        
+        result[0::channels] = self.data[2::3]
+        result[1::channels] = self.data[1::3]
+        result[2::channels] = self.data[0::3]
+        
+        if alpha is not None:
+            result[3::channels] = bytes([ alpha ]) * pixels
+        
+        return result
+    
+    def write_bmp(self, file, offset=0, bits=24):
+        """Writes the image as a 24-bit BGR or 32-bit BGRA (fully opaque)
+        Windows bitmap. Rows are written whole rather than pixel-by-pixel."""
+        
+        if bits not in (24, 32):
+            raise ValueError("can only write 24- or 32-bit bitmaps, not {}".format(bits))
+        
+        row_bytes = self.width * bits // 8
        
         if row_bytes % 4 == 0:
             row_padding = 0
@@ -193,48 +514,350 @@ class Raster_24RGB(Raster):
                                               self.width,
                                               -self.height,
                                               1, # color planes
-                                              24, # bits per pixel
+                                              bits, # bits per pixel
                                               0, # compression type
                                               data_size,
                                               0, # h-res, pixels/metre
                                               0, # v-res, pixels/metre
                                               0, # colors in palette
                                               0)) # important colors in palette
+        
+        data = memoryview(self.bgr_data(alpha=255 if bits == 32 else None))
+        
+        if row_padding:
+            padding = bytes(row_padding)
+            
+            for y in range(self.height):
+                file.write(data[y * row_bytes:(y + 1) * row_bytes])
+                file.write(padding)
+        else:
+            file.write(data)
 
-        for y in range(self.height):
-            for x in range(self.width):
-                BGR = reversed(self[x, y])
-                file.write(bytes(BGR))
-                
-            for i in range(row_padding):
-                file.write(b"\x00")
+class Raster_BMP_24RGB(Raster_24RGB):
+    """A Raster_24RGB whose data is a memory-mapped 24-bit bitmap file,
+    laid out as write_bmp() would write it: the header, then rows of BGR
+    pixels padded to a multiple of four bytes.
+    
+    Drawing writes straight into the file, so images needn't fit in memory
+    and writing them is just a flush. close() when done."""
+    
+    def initialize(self, filename, width, height, fill=None, pen=None, stamps=None):
+        if fill is None:
+            fill = self.default_fill
+        
+        self.width = width
+        self.height = height
+        self.pen = pen or self.default_pen
+        self.stamps = stamps
+        self.data = None # see map
+        
+        self.row_size = (width * 3 + 3) // 4 * 4
+        self.data_offset = WINDOWS_BITMAP_HEADER.size
+        data_size = self.height * self.row_size
+        
+        self.file = open(filename, "w+b")
+        self.file.truncate(self.data_offset + data_size) # zeroed, but likely not taking up disk yet
+        self.file.write(WINDOWS_BITMAP_HEADER.pack(b"BM",
+                                                   self.data_offset + data_size,
+                                                   b"jeba", # unused
+                                                   self.data_offset,
+                                                   40, # size of 2nd half of header
+                                                   width,
+                                                   -height,
+                                                   1, # color planes
+                                                   24, # bits per pixel
+                                                   0, # compression type
+                                                   data_size,
+                                                   0, # h-res, pixels/metre
+                                                   0, # v-res, pixels/metre
+                                                   0, # colors in palette
+                                                   0)) # important colors in palette
+        self.file.flush()
+        
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        
+        if any(fill):
+            row = self.color_fmt.pack(*fill) * width
+            
+            for y in range(height):
+                self.set_span(0, y, row)
+    
+    def _index(self, x, y):
+        return self.data_offset + y * self.row_size + x * 3
+    
+    def get_item(self, x_y):
+        x, y = x_y
+        
+        if not(0 <= x < self.width and
+               0 <= y < self.height):
+            return None
+        
+        i = self._index(x, y)
+        
+        return self.color_fmt.unpack(self.map[i:i + 3])[::-1]
+    
+    def set_item(self, x_y, color):
+        x, y = x_y
+        
+        if not(0 <= x < self.width and
+               0 <= y < self.height):
+            return
+        
+        i = self._index(x, y)
+        
+        self.map[i:i + 3] = self.color_fmt.pack(*color[::-1])
+    
+    def get_span(self, x, y, count):
+        i = self._index(x, y)
+        bgr = self.map[i:i + count * 3]
+        result = bytearray(len(bgr))
+        
+        result[0::3] = bgr[2::3]
+        result[1::3] = bgr[1::3]
+        result[2::3] = bgr[0::3]
+        
+        return result
+    
+    def set_span(self, x, y, data):
+        i = self._index(x, y)
+        bgr = bytearray(len(data))
+        
+        bgr[0::3] = data[2::3]
+        bgr[1::3] = data[1::3]
+        bgr[2::3] = data[0::3]
+        
+        self.map[i:i + len(bgr)] = bgr
+    
+    def copy(self):
+        """Returns a copy of the image as an in-memory Raster_24RGB."""
+        
+        result = Raster_24RGB(0, 0, pen=self.pen, stamps=self.stamps)
+        result.width = self.width
+        result.height = self.height
+        result.data = bytearray().join(self.get_span(0, y, self.width) for y in range(self.height))
+        return result
+    
+    def fade(self, factor):
+        table = bytes(int(i * factor) for i in range(256))
+        
+        # a few rows at a time, so we never hold much of the image in memory;
+        # padding is zero, which stays zero
+        rows = max(1, (1 << 20) // self.row_size)
+        
+        for y in range(0, self.height, rows):
+            start = self._index(0, y)
+            end = self._index(0, min(self.height, y + rows))
+            self.map[start:end] = self.map[start:end].translate(table)
+    
+    def pixels(self):
+        """Returns a (height, width, channels) numpy array of unsigned bytes
+        sharing our data, in RGB order like other Rasters'. It skips each
+        row's padding and walks each pixel's BGR bytes backwards."""
+        
+        return numpy.ndarray((self.height, self.width, 3), dtype=numpy.uint8, buffer=self.map,
+                             offset=self.data_offset + 2, strides=(self.row_size, 3, -1))
+    
+    def bgr_data(self, alpha=None):
+        return self.copy().bgr_data(alpha)
+    
+    def write_bmp(self, file=None, offset=0, bits=24):
+        """Flushes the image to its file, which is already a bitmap. If
+        another file is given it's written there too."""
+        
+        self.map.flush()
+        
+        if file is None:
+            return
+        
+        if offset or bits != 24:
+            return self.copy().write_bmp(file, offset, bits)
+        
+        file.write(self.map)
+    
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+# Tone maps take light accumulated by a Raster_Float_RGB, already scaled
+# by its exposure, and squash it into 0 to 1. They work on floats or on
+# numpy arrays.
+TONE_MAPS = { "linear": lambda light: light, # clipped at 1, like bytes are
+              "reinhard": lambda light: light / (1 + light),
+              "exponential": lambda light: 1 - math.e ** -light }
+
+class Raster_Float_RGB(Raster_24RGB):
+    """A Raster_24RGB which dots are blended into at full precision, in
+    an accumulator of four floats per pixel: red, green and blue light
+    (0 to 1 per channel of each dot) and the coverage (opacity) which
+    brought it. Adding dots up with PEN_ADD this way never saturates, so
+    long exposures of dense clouds keep their detail.
+    
+    Our 24-bit data only holds the image as of the last resolve(), which
+    copy() and write_bmp() do for us. That applies the exposure and tone
+    map to each pixel's coverage, keeping the average color of the light
+    which covered it, and then gamma."""
+    
+    def initialize(self, width, height, fill=None, pen=None, stamps=None,
+                   exposure=1.0, tone="linear", gamma=1.0):
+        super().initialize(width, height, fill, pen, stamps)
+        
+        if tone not in TONE_MAPS:
+            raise ValueError("unknown tone map {!r}; expected one of {}".format(tone, ", ".join(sorted(TONE_MAPS))))
+        
+        self.exposure = exposure
+        self.tone = tone
+        self.gamma = gamma
+        self.accumulator = array("f", bytes(width * height * 4 * 4))
+    
+    def accumulated(self):
+        """Returns a (height, width, 4) numpy array of floats sharing our
+        accumulator, so that changes to it change the image."""
+        
+        return numpy.frombuffer(self.accumulator, dtype=numpy.float32).reshape(self.height, self.width, 4)
+    
+    def point(self, coordinates, color, opacity=1, pen=None):
+        pen = pen or self.pen
+        x, y = [ int(_) for _ in coordinates ]
+        
+        if not(0 <= x < self.width and
+               0 <= y < self.height):
+            return False # OOB
+        
+        # colors may be given as floats (0 to 1)
+        # or as integers (0 to 255)
+        scale = opacity if isinstance(color[0], float) else opacity / 255
+        
+        i = (y * self.width + x) * 4
+        accumulator = self.accumulator
+        
+        for channel in range(3):
+            accumulator[i + channel] = pen(accumulator[i + channel], color[channel] * scale)
+        
+        accumulator[i + 3] = pen(accumulator[i + 3], opacity)
+        
+        return True
+    
+    def dots(self, coordinates, color, opacity=1, pen=None, radius=.5):
+        """Draws many dots at once, like Raster_24RGB.dots(), into the
+        accumulator."""
+        
+        pen = pen or self.pen
+        ufunc = NUMPY_PENS.get(pen)
+        
+        if ufunc is None:
+            return super().dots(coordinates, color, opacity, pen, radius)
+        
+        coordinates = numpy.asarray(coordinates, dtype=numpy.float64).reshape(-1, 2)
+        count = len(coordinates)
+        
+        if not count:
+            return 0
+        
+        colors = numpy.asarray(color, dtype=numpy.float64)
+        
+        if numpy.asarray(color).dtype.kind != "f":
+            colors = colors / 255
+        
+        colors = numpy.broadcast_to(colors, (count, 3))
+        opacities = numpy.broadcast_to(numpy.asarray(opacity, dtype=numpy.float64), (count,))
+        radii = numpy.broadcast_to(numpy.asarray(radius, dtype=numpy.float64), (count,))
+        
+        if self.stamps is not None:
+            dot_indices, x, y, coverages = self._stamped_coverages(coordinates, radii)
+        else:
+            dot_indices, x, y, coverages = self._coverages(coordinates, radii)
+        
+        drawn = (0 <= x) & (x < self.width) & (0 <= y) & (y < self.height)
+        dot_indices = dot_indices[drawn]
+        
+        indices = y[drawn].astype(numpy.int64) * self.width + x[drawn].astype(numpy.int64)
+        weights = opacities[dot_indices] * coverages[drawn]
+        values = numpy.concatenate([ colors[dot_indices] * weights[:, numpy.newaxis],
+                                     weights[:, numpy.newaxis] ], axis=1)
+        
+        accumulated = self.accumulated().reshape(-1, 4)
+        
+        if ufunc is numpy.add:
+            # sum overlapping dots first, only touching the pixels drawn to
+            unique_indices, inverse = numpy.unique(indices, return_inverse=True)
+            
+            for channel in range(4):
+                accumulated[unique_indices, channel] += numpy.bincount(inverse, weights=values[:, channel])
+        else:
+            for channel in range(4):
+                ufunc.at(accumulated[:, channel], indices, values[:, channel].astype(numpy.float32))
+        
+        return len(values)
+    
+    def resolve(self):
+        """Tone maps the accumulator into our 24-bit data."""
+        
+        tone = TONE_MAPS[self.tone]
+        
+        if numpy is not None:
+            accumulated = self.accumulated()
+            coverages = accumulated[:, :, 3:]
+            
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                averages = numpy.where(coverages > 0, accumulated[:, :, :3] / coverages, 0)
+            
+            values = numpy.clip(averages * tone(coverages * self.exposure), 0, 1) ** (1 / self.gamma)
+            self.pixels()[:] = (values * 255 + .5).astype(numpy.uint8)
+            return
+        
+        accumulator = self.accumulator
+        
+        for p in range(self.width * self.height):
+            coverage = accumulator[p * 4 + 3]
+            
+            if coverage <= 0:
+                self.data[p * 3:p * 3 + 3] = bytes(3)
+                continue
+            
+            brightness = tone(coverage * self.exposure) / coverage
+            
+            self.data[p * 3:p * 3 + 3] = bytes(
+                int(min(1, max(0, accumulator[p * 4 + channel] * brightness)) ** (1 / self.gamma) * 255 + .5)
+                for channel in range(3))
+    
+    def copy(self):
+        """Returns a copy of the image, resolved, which doesn't share its
+        data or accumulator."""
+        
+        self.resolve()
+        
+        result = super().copy()
+        result.accumulator = array("f", self.accumulator)
+        return result
+    
+    def fade(self, factor):
+        """Multiplies all the light accumulated by factor (0 to 1)."""
+        
+        if numpy is not None:
+            self.accumulated()[:] *= factor
+        else:
+            self.accumulator = array("f", (value * factor for value in self.accumulator))
+    
+    def bgr_data(self, alpha=None):
+        self.resolve()
+        
+        return super().bgr_data(alpha)
 
 class RGBA_Gradient(object):
+    """A gradient through colors at points, interpolated linearly between
+    them. Calling it with a point gives the color there exactly; colors()
+    gives the colors at many points at once, from a lookup table."""
+    
     def __init__(self, data):
         self.data = sorted(data)
-
+        self.points = [ p for p, c in self.data ]
+        self.tables = {}
+    
     def __call__(self, point):
-        # we just iterate the list to find ours;
-        # it feels like we should be using a binary
-        # search, but given the small size of our data
-        # and the fact that a python function call
-        # would probably take more resources than
-        # iterating the list, we'll just do that.
-        
-        def get_first_index(point):
-            first_index = 0
-            
-            for i, point_color in enumerate(self.data):
-                p, c = point_color
-                
-                if p > point:
-                    return first_index
-                
-                first_index = i
-            else:
-                return first_index
-        
-        first_index = get_first_index(point)
+        # the last color at or before the point (or the first color, if
+        # the point's before all of them)
+        first_index = max(0, bisect_right(self.points, point) - 1)
         first_point, first_color = self.data[first_index]
         
         # if perfect match or nothing follows
@@ -249,16 +872,57 @@ class RGBA_Gradient(object):
             
             first_balance = second_balance = 1/2
         else:
-            first_balance = (point - first_point) / (second_point - first_point)
-            second_balance = 1 - first_balance
-            
-            first_balance, second_balance = second_balance, first_balance # why?
+            second_balance = (point - first_point) / (second_point - first_point)
+            first_balance = 1 - second_balance
         
         result = tuple( first_balance * first +
                         second_balance * second for first, second in zip(first_color,
                                                                          second_color) )
         
         return result
+    
+    def table(self, resolution=1024):
+        """Returns a lookup table of the colors at resolution evenly spaced
+        points from our first point to our last, as a (resolution,
+        channels) numpy array, or a list of tuples without numpy. Tables
+        are only made once for each resolution."""
+        
+        table = self.tables.get(resolution)
+        
+        if table is None:
+            low, high = self.points[0], self.points[-1]
+            step = (high - low) / (resolution - 1) if resolution > 1 else 0
+            
+            table = [ self(low + i * step) for i in range(resolution) ]
+            
+            if numpy is not None:
+                table = numpy.array(table, dtype=numpy.float64)
+            
+            self.tables[resolution] = table
+        
+        return table
+    
+    def colors(self, points, resolution=1024):
+        """Returns the colors at many points, looked up in table(resolution)
+        at the nearest of its points; with numpy that's a single indexed
+        gather giving a (len(points), channels) array. Points outside our
+        range get the color at its nearest end.
+        
+        If resolution is None, each color is exact instead."""
+        
+        if resolution is None:
+            low, high = self.points[0], self.points[-1]
+            return [ self(min(high, max(low, point))) for point in points ]
+        
+        table = self.table(resolution)
+        low, high = self.points[0], self.points[-1]
+        scale = (resolution - 1) / (high - low) if high > low else 0
+        
+        if numpy is not None:
+            indices = numpy.rint((numpy.asarray(points, dtype=numpy.float64) - low) * scale)
+            return table[numpy.clip(indices, 0, resolution - 1).astype(numpy.int64)]
+        
+        return [ table[min(resolution - 1, max(0, round((point - low) * scale)))] for point in points ]
 
 # fades out to purple on either end, runs the RGB spectrum between, so
 # that all channels will be available at full opacity. this is so that
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+import json
+import math
+import os
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from bodies import numpy_system
+import inputs
+
+# Generators of big scenes, each returning a gravity.py input with its
+# objects as a System, sampled with numpy from a seeded generator so the
+# same arguments always give the same scene:
+#
+#     ./scenes.py plummer plummer.columnar --n=100000 --seed=1
+#
+# writes one in inputs.py's columnar format; any of a scene's keyword
+# arguments can be given as --name=value. Scenes other than rings use
+# units where G is 1, like dusty.input.json.py, and come with a view,
+# duration and engine to simulate them with.
+
+IMAGE_SIZE = 1024
+
+# the solar system next to us, wherever we're run from
+SOL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sol.system.json")
+
+def _system(masses, positions, velocities, radii, combining=True):
+    return numpy_system(numpy.broadcast_to(numpy.asarray(masses, dtype=numpy.float64), (len(positions),)),
+                        positions, velocities,
+                        numpy.broadcast_to(numpy.asarray(radii, dtype=numpy.float64), (len(positions),)),
+                        numpy.full(len(positions), bool(combining)))
+
+def _directions(rng, n, dimensions):
+    """Returns n random unit vectors, spread evenly over all directions."""
+    
+    vectors = rng.normal(size=(n, dimensions))
+    return vectors / numpy.sqrt((vectors ** 2).sum(axis=1))[:, numpy.newaxis]
+
+def _input(system, G, extent, crossing_time, crossings=10, frames=1001):
+    """Returns an input drawing system to fit extent in view, for long
+    enough to cross it crossings times."""
+    
+    return { "objects": system,
+             "G": G,
+             "dimensions": [ IMAGE_SIZE, IMAGE_SIZE ],
+             "centre": [ 0, 0 ],
+             "zoom": IMAGE_SIZE / extent,
+             "dt": crossings * crossing_time,
+             "frames": frames,
+             "engine": "numpy" }
+
+def plummer_bodies(rng, n, mass=1.0, scale=100.0, dimensions=3, G=1.0):
+    """Returns the positions and velocities of n bodies of a Plummer
+    sphere of scale radius scale, in equilibrium, centred at rest."""
+    
+    total = n * mass
+    
+    # radii from inverting the cumulative mass, M(<r) = M r^3 / (r^2 + a^2)^3/2
+    fractions = rng.uniform(1e-10, 1 - 1e-10, n)
+    r = scale / numpy.sqrt(fractions ** (-2 / 3) - 1)
+    
+    # speeds as fractions q of the escape speed, sampled from
+    # q^2 (1 - q^2)^7/2 by rejection, a batch at a time
+    q = numpy.empty(0)
+    
+    while len(q) < n:
+        candidates = rng.uniform(0, 1, 2 * n)
+        densities = rng.uniform(0, .1, 2 * n) # the distribution's peak is below .1
+        q = numpy.concatenate([ q, candidates[densities < candidates ** 2 * (1 - candidates ** 2) ** 3.5] ])
+    
+    escape = numpy.sqrt(2 * G * total / numpy.sqrt(r ** 2 + scale ** 2))
+    speeds = q[:n] * escape
+    
+    positions = _directions(rng, n, 3) * r[:, numpy.newaxis]
+    velocities = _directions(rng, n, 3) * speeds[:, numpy.newaxis]
+    
+    # flattened, if need be, and with no overall drift
+    positions = positions[:, :dimensions] - positions[:, :dimensions].mean(axis=0)
+    velocities = velocities[:, :dimensions] - velocities[:, :dimensions].mean(axis=0)
+    
+    return positions, velocities
+
+def plummer(n=100000, seed=0, mass=1.0, scale=100.0, radius=None, dimensions=3, combining=True):
+    """A Plummer sphere of n bodies of the given mass each: a star
+    cluster in equilibrium, with scale radius scale. Bodies' radii are
+    radius, or small enough that they rarely meet."""
+    
+    if numpy is None:
+        raise ImportError("scenes require numpy")
+    
+    rng = numpy.random.default_rng(seed)
+    positions, velocities = plummer_bodies(rng, n, mass, scale, dimensions)
+    
+    radius = radius if radius is not None else scale / 100
+    crossing_time = scale / math.sqrt(n * mass / scale)
+    
+    return _input(_system(mass, positions, velocities, radius, combining), 1, 8 * scale, crossing_time)
+
+def disk(n=100000, seed=0, mass=1.0, scale=100.0, central_mass=None, dispersion=.05, thickness=0,
+         radius=None, combining=True):
+    """An exponential disk galaxy of n bodies of the given mass each, with
+    surface density falling off as exp(-R / scale), around a central body
+    of central_mass (by default as massive as the disk). Each body moves
+    at the circular speed of the mass within its radius, plus a random
+    dispersion as a fraction of that. With a thickness, as a fraction of
+    scale, the disk is 3D."""
+    
+    if numpy is None:
+        raise ImportError("scenes require numpy")
+    
+    rng = numpy.random.default_rng(seed)
+    disk_mass = n * mass
+    central_mass = disk_mass if central_mass is None else central_mass
+    dimensions = 3 if thickness else 2
+    
+    # R exp(-R / scale) is a gamma distribution
+    R = rng.gamma(2, scale, n)
+    angles = rng.uniform(0, 2 * math.pi, n)
+    
+    enclosed = central_mass + disk_mass * (1 - (1 + R / scale) * numpy.exp(-R / scale))
+    circular = numpy.sqrt(enclosed / R)
+    
+    positions = numpy.zeros((n + 1, dimensions))
+    velocities = numpy.zeros((n + 1, dimensions))
+    
+    # the central body comes first
+    positions[1:, 0] = R * numpy.cos(angles)
+    positions[1:, 1] = R * numpy.sin(angles)
+    velocities[1:, 0] = -circular * numpy.sin(angles)
+    velocities[1:, 1] = circular * numpy.cos(angles)
+    velocities[1:] += rng.normal(0, 1, (n, dimensions)) * (dispersion * circular)[:, numpy.newaxis]
+    
+    if thickness:
+        positions[1:, 2] = rng.laplace(0, thickness * scale, n)
+    
+    radius = radius if radius is not None else scale / 100
+    masses = numpy.concatenate([ [ central_mass ], numpy.full(n, mass) ])
+    radii = numpy.concatenate([ [ 4 * radius ], numpy.full(n, radius) ])
+    crossing_time = 2 * math.pi * scale / math.sqrt((central_mass + disk_mass) / scale) # an orbit at scale
+    
+    return _input(_system(masses, positions, velocities, radii, combining), 1, 12 * scale, crossing_time, 3)
+
+def clusters(n=100000, seed=0, mass=1.0, scale=100.0, ratio=1.0, separation=10.0, speed=1.0,
+             impact=2.0, radius=None, dimensions=3, combining=True):
+    """Two Plummer spheres on course to collide, n bodies between them,
+    the second with ratio times the first's bodies. They start separation
+    scale radii apart, approaching at speed times their mutual escape
+    speed at that distance, impact scale radii off head on."""
+    
+    if numpy is None:
+        raise ImportError("scenes require numpy")
+    
+    rng = numpy.random.default_rng(seed)
+    
+    counts = [ int(round(n / (1 + ratio))) ]
+    counts.append(n - counts[0])
+    
+    distance = separation * scale
+    approach = speed * math.sqrt(2 * n * mass / distance)
+    
+    positions, velocities = [], []
+    
+    # each cluster is offset so their centre of mass is at rest at the origin
+    for count, side in zip(counts, (counts[1] / n, -counts[0] / n)):
+        cluster_positions, cluster_velocities = plummer_bodies(rng, count, mass, scale, dimensions)
+        
+        cluster_positions[:, 0] += side * distance
+        cluster_positions[:, 1] += side * impact * scale
+        cluster_velocities[:, 0] -= side * approach
+        
+        positions.append(cluster_positions)
+        velocities.append(cluster_velocities)
+    
+    radius = radius if radius is not None else scale / 100
+    crossing_time = distance / approach
+    
+    return _input(_system(mass, numpy.concatenate(positions), numpy.concatenate(velocities), radius, combining),
+                  1, 2 * distance, crossing_time, 2)
+
+def rings(n=100000, seed=0, system=SOL, body="saturn", inner=1.5, outer=2.5,
+          particle_mass=1e10, particle_radius=None, eccentricity=.001, time=0):
+    """A body of an orbital system, as system2input.py takes (or the
+    filename of one), with its satellites at the given time and a ring of
+    n particles in circular-ish orbits around it, from inner to outer
+    times its radius, with eccentricities spread about eccentricity. The
+    body is at rest at the centre, its primaries left out; in SI units."""
+    
+    if numpy is None:
+        raise ImportError("scenes require numpy")
+    
+    import system2input
+    
+    if isinstance(system, str):
+        with open(system, "rt") as system_file:
+            system = json.load(system_file)
+    
+    found = [ body_dict for name, body_dict, primary in system2input.flatten(system) if name == body ]
+    
+    if not found:
+        raise ValueError("no body named {!r} in the system".format(body))
+    
+    # the body as the root of its own system, so it comes first, at rest
+    central = { key: value for key, value in found[0].items() if key != "orbit" }
+    
+    rng = numpy.random.default_rng(seed)
+    G = system2input.G
+    
+    masses, radii, positions, velocities, dimensions = system2input.system_states({ body: central }, G, time)
+    body_mass, body_radius = masses[0], radii[0]
+    
+    # evenly spread over the ring's area
+    a = body_radius * numpy.sqrt(rng.uniform(inner ** 2, outer ** 2, n))
+    mu = numpy.full(n, G * (body_mass + particle_mass))
+    zeros = numpy.zeros(n)
+    
+    ring_positions, ring_velocities = system2input.orbit_states(
+        mu, a, rng.rayleigh(eccentricity, n), zeros, rng.uniform(0, 2 * math.pi, n), zeros,
+        rng.uniform(0, 2 * math.pi, n))
+    
+    positions = numpy.concatenate([ positions, ring_positions ])[:, :dimensions]
+    velocities = numpy.concatenate([ velocities, ring_velocities ])[:, :dimensions]
+    
+    if particle_radius is None:
+        particle_radius = body_radius * (outer - inner) / math.sqrt(n)
+    
+    all_masses = numpy.concatenate([ masses, numpy.full(n, particle_mass) ])
+    all_radii = numpy.concatenate([ radii, numpy.full(n, particle_radius) ])
+    orbit_time = 2 * math.pi * math.sqrt((outer * body_radius) ** 3 / (G * body_mass))
+    
+    return _input(_system(all_masses, positions, velocities, all_radii), G, 2.5 * outer * body_radius, orbit_time, 3)
+
+scenes = { "plummer": plummer,
+           "disk": disk,
+           "clusters": clusters,
+           "rings": rings }
+
+def main(name, out_filename="-", *options):
+    """Writes the named scene in the columnar format. Options are its
+    keyword arguments, as --name=value, with values parsed as JSON if
+    they can be (so --n=1000 is a number)."""
+    
+    if name not in scenes:
+        raise ValueError("unknown scene {!r}; expected one of {}".format(name, ", ".join(sorted(scenes))))
+    
+    arguments = {}
+    
+    for option in options:
+        if not option.startswith("--") or "=" not in option:
+            raise ValueError("expected --name=value, not {!r}".format(option))
+        
+        key, value = option[2:].split("=", 1)
+        
+        try:
+            arguments[key] = json.loads(value)
+        except ValueError:
+            arguments[key] = value
+    
+    input_dict = scenes[name](**arguments)
+    
+    out_file = open(out_filename, "wb") if out_filename != "-" else sys.stdout.buffer
+    
+    with out_file:
+        inputs.write_columnar(out_file, input_dict)
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+import queue
+import threading
+
+# A bounded queue between each stage of a pipeline lets the stages run
+# at the same time, so it all goes at the speed of its slowest stage,
+# without any stage getting more than a few items ahead of the next.
+
+def buffered(iterable, size=4):
+    """Yields the items of an iterable which is iterated by a background
+    thread, up to size items ahead of us.
+    
+    Anything the iterable raises is raised here instead."""
+    
+    items = queue.Queue(size)
+    
+    def produce():
+        try:
+            for item in iterable:
+                items.put((True, item))
+        except BaseException as error:
+            items.put((False, error))
+        else:
+            items.put((False, None))
+    
+    threading.Thread(target=produce, daemon=True).start()
+    
+    while True:
+        ok, item = items.get()
+        
+        if ok:
+            yield item
+        elif item is not None:
+            raise item
+        else:
+            return
+
+class Consumer(object):
+    """Calls a function with each item put to it from a background thread,
+    holding up to size items waiting their turn.
+    
+    If the function raises, the error is raised again by the next put()
+    or close(), and the remaining items are dropped."""
+    
+    _closed = object()
+    
+    def __init__(self, function, size=4):
+        self.function = function
+        self.items = queue.Queue(size)
+        self.error = None
+        self.thread = threading.Thread(target=self._consume, daemon=True)
+        self.thread.start()
+    
+    def _consume(self):
+        while True:
+            item = self.items.get()
+            
+            if item is self._closed:
+                return
+            
+            if self.error is None:
+                try:
+                    self.function(item)
+                except BaseException as error:
+                    self.error = error
+    
+    def put(self, item):
+        if self.error is not None:
+            raise self.error
+        
+        self.items.put(item)
+    
+    def close(self):
+        """Waits for all items to be consumed."""
+        
+        self.items.put(self._closed)
+        self.thread.join()
+        
+        if self.error is not None:
+            raise self.error
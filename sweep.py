@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout, redirect_stderr
+from copy import deepcopy
+from itertools import product
+import hashlib
+import io
+import json
+import os
+import random
+import sys
+import time
+
+# A sweep renders every combination of some parameters of a base input,
+# each as a job in its own process, several at once. A spec looks like
+#
+#     { "base": "dusty.json", # a gravity.py input, or the input itself
+#       "grid": { "G": [ 1, 2 ],
+#                 "dt": [ 300, 600 ],
+#                 "engine_options.theta": [ .3, .5 ] },
+#       "directory": "sweep" }
+#
+# Grid keys are dotted paths into the input, with list indices as
+# numbers (eg. "objects.0.m"). Instead of (or as well as) a base input
+# there may be:
+#
+# - "system", an orbital system as system2input.py takes, whose objects
+#   replace the input's; paths into it start "system.", eg.
+#   "system.sol.satellites.mercury.orbit.eccentricity"
+# - "generator", a script printing an input, like dusty.input.json.py,
+#   which is run with random seeded by the "seed" parameter; the base
+#   input's values are put over the generated one's
+#
+# Each job is named by a hash of everything it's made from, and its
+# output, input, log and metrics are written in the directory under that
+# name. manifest.json there records each job's parameters, outputs and
+# timing; jobs it records as done are skipped when the sweep is run
+# again, so adding values to a grid only runs the new combinations. The
+# spec may also give "processes", how many jobs to run at once (one per
+# CPU by default), and "out", the output's filename ("{name}.bmp").
+
+MANIFEST = "manifest.json"
+
+def set_path(target, path, value):
+    """Sets the value at a dotted path in nested dicts and lists."""
+    
+    *parents, last = path.split(".")
+    
+    for key in parents:
+        target = target[int(key)] if isinstance(target, list) else target.setdefault(key, {})
+    
+    if isinstance(target, list):
+        target[int(last)] = value
+    else:
+        target[last] = value
+
+def _load(value):
+    """Returns a spec's value, loaded from a JSON file if it's a filename."""
+    
+    if isinstance(value, str):
+        with open(value, "rt") as file:
+            return json.load(file)
+    
+    return deepcopy(value)
+
+def jobs(spec):
+    """Yields a (name, parameters, job) for each combination of the spec's
+    grid, job being the dict run_job takes."""
+    
+    base = _load(spec.get("base", {}))
+    system = _load(spec["system"]) if "system" in spec else None
+    generator = None
+    
+    if "generator" in spec:
+        with open(spec["generator"], "rt") as generator_file:
+            generator = generator_file.read()
+    
+    grid = spec.get("grid", {})
+    keys = sorted(grid)
+    
+    for values in product(*[ grid[key] for key in keys ]):
+        parameters = dict(zip(keys, values))
+        job = { "input": deepcopy(base),
+                "system": deepcopy(system),
+                "generator": generator,
+                "seed": parameters.get("seed") }
+        
+        for key, value in parameters.items():
+            if key == "seed":
+                continue
+            elif key.startswith("system."):
+                set_path(job["system"], key[len("system."):], value)
+            else:
+                set_path(job["input"], key, value)
+        
+        # sort_keys so the same job always hashes the same
+        digest = hashlib.sha256(json.dumps(job, sort_keys=True).encode("utf-8")).hexdigest()
+        
+        yield digest[:16], parameters, job
+
+def build_input(job):
+    """Returns the gravity.py input a job describes."""
+    
+    input_dict = {}
+    
+    if job["generator"] is not None:
+        random.seed(job["seed"])
+        printed = io.StringIO()
+        
+        with redirect_stdout(printed):
+            exec(compile(job["generator"], "<generator>", "exec"), { "__name__": "__main__" })
+        
+        input_dict.update(json.loads(printed.getvalue()))
+    
+    input_dict.update(job["input"])
+    
+    if job["system"] is not None:
+        from system2input import system_to_input
+        
+        input_dict["objects"] = system_to_input(job["system"])["objects"]
+    
+    return input_dict
+
+def run_job(directory, name, job, out_template):
+    """Renders a job in directory, returning its manifest entry. Run in a
+    worker process."""
+    
+    import gravity
+    
+    path = lambda suffix: os.path.join(directory, name + suffix)
+    out_filename = os.path.join(directory, out_template.format(name=name))
+    start = time.time()
+    
+    input_dict = build_input(job)
+    input_dict["metrics"] = path(".metrics.json")
+    
+    with open(path(".json"), "wt") as input_file:
+        json.dump(input_dict, input_file, default=list)
+    
+    with open(path(".log"), "wt") as log, redirect_stderr(log):
+        random.seed(job["seed"])
+        gravity.main(path(".json"), out_filename)
+    
+    with open(path(".metrics.json"), "rt") as metrics_file:
+        metrics = json.load(metrics_file)
+    
+    return { "out": out_filename,
+             "seconds": time.time() - start,
+             "stage seconds": metrics["stage seconds"],
+             "counts": metrics["counts"] }
+
+def load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST), "rt") as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return {}
+
+def save_manifest(directory, manifest):
+    """Writes the manifest, replacing the old one only once it's complete."""
+    
+    filename = os.path.join(directory, MANIFEST)
+    
+    with open(filename + ".tmp", "wt") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        manifest_file.write("\n")
+    
+    os.replace(filename + ".tmp", filename)
+
+def done(entry):
+    """Returns whether a manifest entry is for a job which finished and
+    whose output is still there."""
+    
+    if entry is None or entry.get("status") != "done":
+        return False
+    
+    return "{" in entry["out"] or os.path.exists(entry["out"]) # streamed outputs are many files
+
+def sweep(spec, processes=None):
+    """Runs each job of a sweep not already done, processes (the spec's
+    "processes", or one per CPU) at a time, and returns the manifest."""
+    
+    directory = spec.get("directory", "sweep")
+    out_template = spec.get("out", "{name}.bmp")
+    processes = processes or spec.get("processes") or os.cpu_count()
+    
+    os.makedirs(directory, exist_ok=True)
+    manifest = load_manifest(directory)
+    
+    pending = []
+    
+    for name, parameters, job in jobs(spec):
+        if done(manifest.get(name)):
+            sys.stderr.write("Skipping {} {}, already done.\n".format(name, json.dumps(parameters)))
+        else:
+            pending.append((name, parameters, job))
+    
+    sys.stderr.write("Running {} jobs, {} at a time...\n".format(len(pending), processes))
+    start = time.time()
+    
+    with ProcessPoolExecutor(processes) as pool:
+        futures = { pool.submit(run_job, directory, name, job, out_template): (name, parameters)
+                    for name, parameters, job in pending }
+        
+        for finished, future in enumerate(as_completed(futures), 1):
+            name, parameters = futures[future]
+            entry = { "parameters": parameters }
+            
+            try:
+                entry.update(future.result(), status="done")
+            except Exception as error:
+                entry.update(status="failed", error="{}: {}".format(type(error).__name__, error))
+            
+            manifest[name] = entry
+            save_manifest(directory, manifest) # as we go, so an interrupted sweep can carry on
+            
+            sys.stderr.write("[{}/{}] {} {} {}{}\n".format(
+                finished, len(pending), name, json.dumps(parameters), entry["status"],
+                " in {:.1f}s".format(entry["seconds"]) if "seconds" in entry else ": " + entry.get("error", "")))
+    
+    sys.stderr.write("Complete. Total clock time elasped has been {:.1f}.\n".format(time.time() - start))
+    
+    return manifest
+
+def main(spec_filename, *arguments):
+    """Runs a sweep spec. --processes=N overrides how many jobs run at once."""
+    
+    processes = None
+    
+    for argument in arguments:
+        if argument.startswith("--processes="):
+            processes = int(argument.split("=", 1)[1])
+        else:
+            raise ValueError("unknown argument {!r}".format(argument))
+    
+    with open(spec_filename, "rt") as spec_file:
+        spec = json.load(spec_file)
+    
+    manifest = sweep(spec, processes)
+    
+    return 1 if any(entry["status"] != "done" for entry in manifest.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
@@ -1,49 +1,283 @@
 #!/usr/bin/env python3
-from copy import copy, deepcopy
-from gravity import V#ector
-from math import pi as PI
 import json
+import math
 import sys
 
-def system_to_input(system):
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from bodies import numpy_system
+
+# An orbital system is a dict of bodies by name, each with a "mass", a
+# "mean radius", optional "satellites" (another such dict) and, for all
+# but the root, an "orbit" around the body it's a satellite of:
+#
+# - "semi-major axis" (metres) and "eccentricity", which must be below 1
+# - "inclination", "argument of periapsis", "longitude of ascending
+#   node" and "mean anomaly" (degrees), each 0 if missing
+# - "epoch" (seconds), the time the mean anomaly is for, 0 if missing
+#
+# Each body is placed where its orbit has it at the given time, moving
+# as a two-body orbit with G * (its mass + its primary's) would, so
+# simulations start in the right state rather than needing to settle.
+# All the orbits are worked out together, as arrays with numpy. If no
+# orbit is inclined the system is 2D, otherwise 3D, and the input says to
+# use the numpy engine, as the python engine only simulates 2D.
+
+G = 6.67428e-11 # as gravity.py uses by default
+
+def flatten(system):
+    """Returns a list of (name, body dict, index of primary or None) for
+    every body in an orbital system, each before its satellites."""
+    
+    bodies = []
+    
+    def add(objects, primary):
+        for name, body in objects.items():
+            bodies.append((name, body, primary))
+            
+            if "satellites" in body:
+                add(body["satellites"], len(bodies) - 1)
+    
+    add(system, None)
+    
+    return bodies
+
+def solve_kepler(mean_anomalies, eccentricities, tolerance=1e-14, max_iterations=64):
+    """Returns the eccentric anomalies E with E - e sin E = M for each
+    mean anomaly M and eccentricity e, by Newton's method: numpy arrays
+    given numpy arrays, or a float given floats.
+    
+    E - M is e sin E, so E is always within e of M; Newton steps which
+    would leave that bracket bisect it instead, which converges however
+    eccentric the orbit. Raises ValueError if it still hasn't converged
+    after max_iterations."""
+    
+    if numpy is not None and isinstance(mean_anomalies, numpy.ndarray):
+        sin, cos, where, sign, floor = numpy.sin, numpy.cos, numpy.where, numpy.sign, numpy.floor
+        inside = lambda x, low, high: (low <= x) & (x <= high)
+        largest = lambda x: abs(x).max(initial=0)
+    else:
+        sin, cos, floor = math.sin, math.cos, math.floor
+        where = lambda condition, a, b: a if condition else b
+        sign = lambda x: math.copysign(1, x) if x else 0
+        inside = lambda x, low, high: low <= x <= high
+        largest = abs
+    
+    # solved within a turn of periapsis, then moved back by whole turns
+    turns = 2 * math.pi * floor((mean_anomalies + math.pi) / (2 * math.pi))
+    M, e = mean_anomalies - turns, eccentricities
+    low, high = M - e, M + e
+    
+    # close enough to start from, even for very eccentric orbits
+    E = where(e > .8, M + .85 * e * sign(M), M + e * sin(M))
+    
+    for _ in range(max_iterations):
+        residual = E - e * sin(E) - M
+        
+        # the residual grows with E, so its sign says which side E is on
+        low = where(residual < 0, E, low)
+        high = where(residual > 0, E, high)
+        
+        newton = E - residual / (1 - e * cos(E))
+        improved = where(inside(newton, low, high), newton, (low + high) / 2)
+        change = improved - E
+        E = improved
+        
+        if largest(change) < tolerance:
+            return E + turns
+    
+    raise ValueError("Kepler's equation didn't converge in {} iterations".format(max_iterations))
+
+def orbit_states(mu, a, e, inclination, argument, node, mean_anomaly):
+    """Returns the positions and velocities, relative to their primaries,
+    of bodies on Kepler orbits of the given gravitational parameters (G *
+    total mass), semi-major axes, eccentricities and angles (radians), as
+    (N, 3) numpy arrays from arrays or 3-lists from floats."""
+    
+    if numpy is not None and isinstance(mu, numpy.ndarray):
+        sin, cos, sqrt = numpy.sin, numpy.cos, numpy.sqrt
+    else:
+        sin, cos, sqrt = math.sin, math.cos, math.sqrt
+    
+    E = solve_kepler(mean_anomaly, e)
+    speed = sqrt(mu / a) / (1 - e * cos(E)) # a * mean motion / (1 - e cos E)
+    minor = sqrt(1 - e * e)
+    
+    # in the orbit's plane, periapsis along x
+    x, y = a * (cos(E) - e), a * minor * sin(E)
+    v_x, v_y = -speed * sin(E), speed * minor * cos(E)
+    
+    # directions of those x and y axes, having rotated by the argument of
+    # periapsis, inclined, and rotated by the longitude of the node
+    cos_w, sin_w = cos(argument), sin(argument)
+    cos_i, sin_i = cos(inclination), sin(inclination)
+    cos_n, sin_n = cos(node), sin(node)
+    
+    P = (cos_n * cos_w - sin_n * sin_w * cos_i, sin_n * cos_w + cos_n * sin_w * cos_i, sin_w * sin_i)
+    Q = (-cos_n * sin_w - sin_n * cos_w * cos_i, -sin_n * sin_w + cos_n * cos_w * cos_i, cos_w * sin_i)
+    
+    positions = [ x * p + y * q for p, q in zip(P, Q) ]
+    velocities = [ v_x * p + v_y * q for p, q in zip(P, Q) ]
+    
+    if numpy is not None and isinstance(mu, numpy.ndarray):
+        return numpy.stack(positions, axis=-1), numpy.stack(velocities, axis=-1)
+    
+    return positions, velocities
+
+def system_states(system, G=G, time=0):
+    """Returns the masses, radii, positions and velocities of every body
+    of an orbital system, in flatten()'s order, and the number of
+    dimensions they need. Positions and velocities are (N, 3) numpy
+    arrays with numpy, or lists of 3-lists."""
+    
+    bodies = flatten(system)
+    count = len(bodies)
+    
+    masses = [ body["mass"] for name, body, primary in bodies ]
+    radii = [ body["mean radius"] for name, body, primary in bodies ]
+    
+    orbiting = [ k for k, (name, body, primary) in enumerate(bodies) if primary is not None and "orbit" in body ]
+    orbits = [ bodies[k][1]["orbit"] for k in orbiting ]
+    
+    if any(orbit["eccentricity"] >= 1 for orbit in orbits):
+        raise ValueError("can only place bodies on closed orbits, with eccentricity below 1")
+    
+    element = lambda key, default=0: [ orbit.get(key, default) for orbit in orbits ]
+    angle = lambda key: [ math.radians(value) for value in element(key) ]
+    
+    mu = [ G * (masses[k] + masses[bodies[k][2]]) for k in orbiting ]
+    a = element("semi-major axis")
+    mean_anomaly = [ math.radians(m) + math.sqrt(mu_k / a_k ** 3) * (time - epoch)
+                     for m, mu_k, a_k, epoch in zip(element("mean anomaly"), mu, a, element("epoch")) ]
+    
+    dimensions = 3 if any(element("inclination")) else 2
+    elements = (mu, a, element("eccentricity"), angle("inclination"), angle("argument of periapsis"),
+                angle("longitude of ascending node"), mean_anomaly)
+    
+    if numpy is not None:
+        positions = numpy.zeros((count, 3))
+        velocities = numpy.zeros((count, 3))
+        
+        if orbiting:
+            positions[orbiting], velocities[orbiting] = orbit_states(*[ numpy.array(values, dtype=numpy.float64)
+                                                                        for values in elements ])
+    else:
+        positions = [ [ 0.0 ] * 3 for _ in range(count) ]
+        velocities = [ [ 0.0 ] * 3 for _ in range(count) ]
+        
+        for k, values in zip(orbiting, zip(*elements)):
+            positions[k], velocities[k] = orbit_states(*values)
+    
+    # add each primary's position and velocity to its satellites', which
+    # comes after it. bodies without orbits move with their primaries.
+    depths = [ 0 ] * count
+    
+    for k, (name, body, primary) in enumerate(bodies):
+        if primary is not None:
+            depths[k] = depths[primary] + 1
+    
+    for depth in range(1, max(depths + [ 0 ]) + 1):
+        level = [ k for k in range(count) if depths[k] == depth ]
+        primaries = [ bodies[k][2] for k in level ]
+        
+        if numpy is not None:
+            positions[level] += positions[primaries]
+            velocities[level] += velocities[primaries]
+        else:
+            for k, primary in zip(level, primaries):
+                positions[k] = [ c + p for c, p in zip(positions[k], positions[primary]) ]
+                velocities[k] = [ c + p for c, p in zip(velocities[k], velocities[primary]) ]
+    
+    return masses, radii, positions, velocities, dimensions
+
+def system_to_input(system, G=G, time=0):
     """generates input for gravity.py from a dictionary representing an orbital system"""
     
     if len(system) != 1:
         raise ValueError("Input system must have a single root body.")
     
-    result_objects = []
-    
-    def add_objects(objects, position_orbiting=V(0, 0), velocity_orbiting=V(0, 0)):
-        for name, object_dict in objects.items():
-            object = { "comment": name,
-                       "m": object_dict["mass"],
-                       "radius": object_dict["mean radius"] }
-            if "orbit" in object_dict:
-                object.update({ "v": V(0, object_dict["orbit"]["semi-major axis"] * 2 * PI / object_dict["orbit"]["period"]) + velocity_orbiting,
-                                "d": V(object_dict["orbit"]["semi-major axis"] * (1 - object_dict["orbit"]["eccentricity"]), 0) + position_orbiting })
-            else:
-                object["v"] = V(0, 0)
-                object["d"] = deepcopy(position_orbiting)
-            
-            # this is pretty far from accurate at the moment
-            
-            result_objects.append(object)
+    masses, radii, positions, velocities, dimensions = system_states(system, G, time)
+    
+    if numpy is not None:
+        positions, velocities = positions.tolist(), velocities.tolist()
+    
+    input_dict = { "G": G,
+                   "objects": [ { "comment": name,
+                                  "m": mass,
+                                  "radius": radius,
+                                  "d": position[:dimensions],
+                                  "v": velocity[:dimensions] }
+                                for (name, body, primary), mass, radius, position, velocity
+                                in zip(flatten(system), masses, radii, positions, velocities) ] }
+    
+    if dimensions > 2:
+        input_dict["engine"] = "numpy"
+    
+    return input_dict
 
-            if "satellites" in object_dict:
-                add_objects(object_dict["satellites"], object["d"], object["v"])
+def system_to_columnar_input(system, G=G, time=0):
+    """Like system_to_input(), but with the input's objects as a System,
+    built straight from arrays with numpy, to save as a columnar input."""
+    
+    if numpy is None:
+        import inputs
+        
+        input_dict = system_to_input(system, G, time)
+        input_dict["objects"] = inputs.system_from_dicts(input_dict["objects"])
+        return input_dict
+    
+    if len(system) != 1:
+        raise ValueError("Input system must have a single root body.")
     
-    add_objects(system)
+    masses, radii, positions, velocities, dimensions = system_states(system, G, time)
     
-    return { "objects": result_objects }
+    input_dict = { "G": G,
+                   "objects": numpy_system(numpy.array(masses, dtype=numpy.float64),
+                                           positions[:, :dimensions], velocities[:, :dimensions],
+                                           numpy.array(radii, dtype=numpy.float64),
+                                           numpy.ones(len(masses), dtype=bool)) }
+    
+    if dimensions > 2:
+        input_dict["engine"] = "numpy"
+    
+    return input_dict
 
-def main(in_filename="-", out_filename="-"):
+def main(in_filename="-", out_filename="-", *options):
+    """Writes gravity.py input for an orbital system, as JSON or, with
+    --columnar, in inputs.py's columnar format. --time=SECONDS places
+    the bodies at that time instead of 0."""
+    
+    columnar = False
+    time = 0
+    
+    for option in options:
+        if option == "--columnar":
+            columnar = True
+        elif option.startswith("--time="):
+            time = float(option.split("=", 1)[1])
+        else:
+            raise ValueError("unknown option {!r}".format(option))
+    
     in_file  = open(in_filename,  "rt") if in_filename  != "-" else sys.stdin
-    out_file = open(out_filename, "wt") if out_filename != "-" else sys.stdout
     
-    with in_file, out_file:
+    with in_file:
         in_dict = json.load(in_file)
-        out_dict = system_to_input(in_dict)
-        json.dump(out_dict, out_file, indent=2, default=list)
+    
+    if columnar:
+        import inputs
+        
+        out_file = open(out_filename, "wb") if out_filename != "-" else sys.stdout.buffer
+        
+        with out_file:
+            inputs.write_columnar(out_file, system_to_columnar_input(in_dict, time=time))
+    else:
+        out_file = open(out_filename, "wt") if out_filename != "-" else sys.stdout
+        
+        with out_file:
+            json.dump(system_to_input(in_dict, time=time), out_file, indent=2)
 
 if __name__ == "__main__":
     sys.exit(main(*sys.argv[1:]))
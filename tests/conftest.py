@@ -0,0 +1,30 @@
+import json
+import os
+import random
+import sys
+
+import pytest
+
+# the modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def dusty_input(tmp_path):
+    """Returns a function writing a small input of dust to a file, with
+    any other settings given, and returning the file's name."""
+    
+    generator = random.Random(0)
+    r = lambda scale: (generator.random() * 2 - 1) * scale
+    objects = [ { "m": 1, "d": [ r(100), r(100) ], "v": [ r(.5), r(.5) ], "radius": 2 } for _ in range(30) ]
+    
+    def write(name="input.json", **settings):
+        input_dict = { "dimensions": [ 64, 48 ], "zoom": .25, "G": 1, "dt": 300, "frames": 25,
+                       "objects": objects }
+        input_dict.update(settings)
+        
+        path = tmp_path / name
+        path.write_text(json.dumps(input_dict))
+        
+        return str(path)
+    
+    return write
@@ -0,0 +1,31 @@
+import random
+
+import pytest
+
+import barnes_hut
+
+def relative_errors(positions, masses, theta):
+    approximate = barnes_hut.accelerations(positions, masses, 1, theta)
+    exact = barnes_hut.accelerations(positions, masses, 1, 0)
+    
+    return [ sum((a - e) ** 2 for a, e in zip(a_i, e_i)) ** .5 / sum(e * e for e in e_i) ** .5
+             for a_i, e_i in zip(approximate, exact) ]
+
+@pytest.mark.parametrize("theta", [ .5, 1.0, 1.5, 3.0 ])
+def test_bodies_never_pull_themselves(theta):
+    # with a wide enough opening angle, the root itself passes the test
+    # for both bodies, which would have each pull itself
+    errors = relative_errors([ [ 0.0, 0.0 ], [ 10.0, 10.0 ] ], [ 1, 1 ], theta)
+    
+    assert max(errors) < 1e-12
+
+def test_theta_zero_is_the_direct_sum():
+    generator = random.Random(0)
+    positions = [ [ generator.uniform(-100, 100) for _ in range(3) ] for _ in range(200) ]
+    masses = [ generator.uniform(1, 10) for _ in range(200) ]
+    
+    approximate = barnes_hut.accelerations(positions, masses, 1, 0)
+    exact = barnes_hut.direct_accelerations(positions, masses, 1)
+    
+    for a_i, e_i in zip(approximate, exact):
+        assert a_i == pytest.approx(e_i, rel=1e-9, abs=1e-12)
@@ -0,0 +1,26 @@
+from array import array
+
+import binary
+
+def test_padding():
+    assert [ len(binary.padding(size)) for size in (0, 1, 7, 8, 9) ] == [ 0, 7, 1, 0, 7 ]
+
+def test_round_trip_on_either_host(monkeypatch):
+    for byteorder in ("little", "big"):
+        monkeypatch.setattr(binary.sys, "byteorder", byteorder)
+        
+        values = array("d", [ 1.5, -2.0, 3e100 ])
+        data = binary.little_endian(values).tobytes()
+        
+        assert list(values) == [ 1.5, -2.0, 3e100 ] # never changed in place
+        
+        read = array("d")
+        binary.extend_little_endian(read, data)
+        
+        assert read == values
+    
+    # so what's written on a big-endian host is what a little-endian one writes
+    monkeypatch.setattr(binary.sys, "byteorder", "big")
+    swapped = binary.little_endian(array("I", [ 1 ])).tobytes()
+    
+    assert swapped == b"\x00\x00\x00\x01"
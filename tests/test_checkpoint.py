@@ -0,0 +1,37 @@
+import pytest
+
+import checkpoint
+import gravity
+import raster
+
+class Killed(Exception):
+    pass
+
+@pytest.mark.parametrize("engine", [ "python", "numpy" ])
+def test_resumed_render_matches_uninterrupted(tmp_path, monkeypatch, dusty_input, engine):
+    gravity.main(dusty_input(engine=engine), str(tmp_path / "whole.bmp"))
+    
+    in_filename = dusty_input("checkpointed.json", engine=engine, checkpoint=str(tmp_path / "checkpoint"),
+                              checkpoint_every=7)
+    spectrum = raster.mah_spectrum
+    
+    # killed part way through, after a couple of checkpoints
+    def dying(p):
+        if p > .6:
+            raise Killed()
+        
+        return spectrum(p)
+    
+    monkeypatch.setattr(raster, "mah_spectrum", dying)
+    
+    with pytest.raises(Killed):
+        gravity.main(in_filename, str(tmp_path / "resumed.bmp"))
+    
+    monkeypatch.setattr(raster, "mah_spectrum", spectrum)
+    
+    # the second checkpoint may still have been being saved
+    assert checkpoint.load(str(tmp_path / "checkpoint")).drawn in (6, 13)
+    
+    gravity.main(in_filename, str(tmp_path / "resumed.bmp"), resume=True)
+    
+    assert (tmp_path / "resumed.bmp").read_bytes() == (tmp_path / "whole.bmp").read_bytes()
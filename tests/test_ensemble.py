@@ -0,0 +1,38 @@
+import random
+
+import numpy
+
+import ensemble
+import gravity
+
+def dust(n, seed):
+    generator = random.Random(seed)
+    r = lambda scale: (generator.random() * 2 - 1) * scale
+    
+    return [ gravity.Object(1, [ r(20), r(20) ], [ r(1), r(1) ], 2) for _ in range(n) ]
+
+def test_colliding_systems_in_blocks():
+    systems = ensemble.Ensemble.from_systems([ dust(2 + seed % 7, seed) for seed in range(50) ])
+    everything = ensemble.colliding_systems(systems, block_size=len(systems))
+    
+    assert len(everything)
+    
+    for block_size in (1, 3, 16):
+        assert ensemble.colliding_systems(systems, block_size=block_size).tolist() == everything.tolist()
+
+def test_ensemble_matches_numpy_engine():
+    systems = [ dust(8, seed) for seed in range(5) ]
+    frames = ensemble.simulate_ensemble(ensemble.Ensemble.from_systems(systems), 10, G=1)
+    
+    for _ in range(30):
+        stepped = next(frames)
+    
+    for i, system in enumerate(systems):
+        engine_frames = gravity.simulate_numpy(system, 10, G=1)
+        
+        for _ in range(30):
+            expected = next(engine_frames)
+        
+        masses, displacements, velocities, radii, combining = gravity.numpy_views(expected)
+        
+        assert numpy.array_equal(stepped.system_arrays(i)[1], displacements)
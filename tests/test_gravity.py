@@ -0,0 +1,47 @@
+import json
+
+import numpy
+import pytest
+
+import gravity
+import trajectory
+
+@pytest.mark.parametrize("key, value", [ ("engine", "nunpy"), ("integrator", "rk5") ])
+def test_main_checks_names_before_opening_outputs(tmp_path, key, value):
+    in_filename = tmp_path / "input.json"
+    out_filename = tmp_path / "out.bmp"
+    
+    in_filename.write_text(json.dumps({ "objects": [ { "m": 1, "d": [ 0, 0 ] } ], key: value }))
+    out_filename.write_bytes(b"previous output")
+    
+    with pytest.raises(ValueError, match="expected one of"):
+        gravity.main(str(in_filename), str(out_filename))
+    
+    assert out_filename.read_bytes() == b"previous output"
+
+@pytest.mark.parametrize("engine", [ "python", "numpy" ])
+def test_draw_every_draws_the_last_frame(tmp_path, dusty_input, engine):
+    last_frames = []
+    
+    for draw_every in (1, 5):
+        recorded = str(tmp_path / "{}.traj".format(draw_every))
+        gravity.main(dusty_input(engine=engine, frames=23, draw_every=draw_every, integrator="leapfrog",
+                                 trajectory=recorded), str(tmp_path / "out.bmp"))
+        
+        reader = trajectory.Reader(recorded)
+        frames = list(reader.frames())
+        
+        assert [ frame.frame for frame in frames ] == list(range(0, 23, draw_every)) + [ 22 ] * (draw_every > 1)
+        last_frames.append(numpy.array(frames[-1].positions))
+        
+        reader.close()
+    
+    assert numpy.array_equal(*last_frames)
+
+def test_main_rejects_streaming_bitmaps_to_stdout(tmp_path, monkeypatch, dusty_input):
+    monkeypatch.chdir(tmp_path)
+    
+    with pytest.raises(ValueError, match="output filename"):
+        gravity.main(dusty_input(stream="bmp"), "-")
+    
+    assert not (tmp_path / "-").exists()
@@ -0,0 +1,54 @@
+import io
+import json
+
+import pytest
+
+import inputs
+
+TEXT = json.dumps({ "G": 1,
+                    "objects": [ { "m": 2, "d": [ 1, 2 ], "v": [ 0, -1 ], "radius": 3 },
+                                 { "m": 1, "d": [ -1, 0, 4 ] } ],
+                    "frames": 10 }, indent=2)
+
+def test_read_json():
+    input_dict = inputs.read_json(TEXT)
+    system = input_dict["objects"]
+    
+    assert input_dict["G"] == 1 and input_dict["frames"] == 10
+    assert list(system.masses) == [ 2, 1 ]
+    assert system.dimensions == 3
+    assert list(system.displacements) == [ 1, 2, 0, -1, 0, 4 ]
+    
+    assert len(inputs.read_json("{ }")["objects"]) == 0
+    assert len(inputs.read_json('{ "objects": [ ] }\n')["objects"]) == 0
+
+@pytest.mark.parametrize("trailing", [ "x", "}", "{}", ", 1", "\n\n[]" ])
+def test_read_json_rejects_trailing_data(trailing):
+    with pytest.raises(ValueError):
+        inputs.read_json(TEXT + trailing)
+    
+    with pytest.raises(ValueError):
+        inputs.read_json("{}" + trailing)
+
+def test_read_json_rejects_truncated_input():
+    for length in range(len(TEXT)):
+        with pytest.raises(ValueError):
+            inputs.read_json(TEXT[:length])
+
+def test_read_json_rejects_non_string_keys():
+    with pytest.raises(ValueError):
+        inputs.read_json('{ 1: 2 }')
+
+def test_columnar_round_trip_and_truncation():
+    data = io.BytesIO()
+    inputs.write_columnar(data, inputs.read_json(TEXT))
+    data = data.getvalue()
+    
+    input_dict = inputs.read(io.BytesIO(data))
+    
+    assert input_dict["G"] == 1
+    assert list(input_dict["objects"].displacements) == [ 1, 2, 0, -1, 0, 4 ]
+    
+    for length in (0, 4, inputs.HEADER.size, len(data) - 8):
+        with pytest.raises(ValueError):
+            inputs.read_columnar(memoryview(data[:length]))
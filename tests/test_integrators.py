@@ -0,0 +1,37 @@
+import numpy
+import pytest
+
+import integrators
+
+def test_adaptive_caps_force_evaluations():
+    # a head-on plunge, so accelerations change quickly however small the substeps
+    positions = numpy.array([ [ -1.0, 0.0 ], [ 1.0, 0.0 ] ])
+    velocities = numpy.zeros_like(positions)
+    evaluations = []
+    
+    def accelerations(positions):
+        evaluations.append(1)
+        separation = positions[1] - positions[0]
+        pull = separation / (separation ** 2).sum() ** 1.5
+        return numpy.array([ pull, -pull ])
+    
+    with pytest.warns(RuntimeWarning):
+        new_positions, new_velocities, final = integrators.adaptive(positions, velocities, accelerations, 1.0,
+                                                                    max_evaluations=16)
+    
+    assert len(evaluations) <= 17 # the cap, and the rest of the step
+    assert numpy.isfinite(new_positions).all()
+
+def test_adaptive_quiet_step_is_one_evaluation():
+    positions = numpy.array([ [ -100.0, 0.0 ], [ 100.0, 0.0 ] ])
+    velocities = numpy.zeros_like(positions)
+    initial = numpy.zeros_like(positions)
+    evaluations = []
+    
+    def accelerations(positions):
+        evaluations.append(1)
+        return numpy.zeros_like(positions)
+    
+    integrators.adaptive(positions, velocities, accelerations, 1.0, initial)
+    
+    assert len(evaluations) == 1
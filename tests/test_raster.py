@@ -0,0 +1,112 @@
+import io
+import random
+import struct
+
+import pytest
+
+import raster
+
+def random_raster(width, height, seed=0):
+    image = raster.Raster_24RGB(width, height)
+    image.data[:] = random.Random(seed).randbytes(len(image.data))
+    return image
+
+def reference_bmp(image, bits):
+    """The bitmap write_bmp() used to write, a pixel at a time."""
+    
+    row_bytes = image.width * bits // 8
+    padding = bytes(-row_bytes % 4)
+    data = bytearray()
+    
+    for y in range(image.height):
+        for x in range(image.width):
+            data += bytes(image[x, y][::-1])
+            
+            if bits == 32:
+                data += b"\xff"
+        
+        data += padding
+    
+    header = struct.pack("<2sI4sIIiiHHIIiiII", b"BM", 54 + len(data), b"jeba", 54, 40,
+                         image.width, -image.height, 1, bits, 0, len(data), 0, 0, 0, 0)
+    
+    return header + data
+
+@pytest.mark.parametrize("bits", [ 24, 32 ])
+@pytest.mark.parametrize("width", [ 1, 2, 3, 4, 5, 7, 8 ])
+def test_write_bmp_matches_per_pixel_encoding(width, bits):
+    image = random_raster(width, 3)
+    out = io.BytesIO()
+    
+    image.write_bmp(out, bits=bits)
+    
+    assert out.getvalue() == reference_bmp(image, bits)
+
+def random_dots(brightest, count=40, width=32, height=24, seed=1):
+    rng = random.Random(seed)
+    
+    # some hanging off the edges, and some big enough to overlap
+    coordinates = [ (rng.uniform(-3, width + 3), rng.uniform(-3, height + 3)) for _ in range(count) ]
+    colors = [ (rng.randrange(brightest), rng.randrange(brightest), rng.randrange(brightest)) for _ in range(count) ]
+    opacities = [ rng.uniform(.2, 1) for _ in range(count) ]
+    radii = [ rng.choice([ .5, .8, 1.5, 3.2 ]) for _ in range(count) ]
+    
+    return coordinates, colors, opacities, radii
+
+# dot() doesn't clip, so added dots are kept dim enough not to overflow
+@pytest.mark.parametrize("pen, brightest", [ (raster.PEN_ADD, 40), (raster.PEN_MAX, 200), (raster.PEN_MIN, 200) ],
+                         ids=[ "add", "max", "min" ])
+@pytest.mark.parametrize("kind", [ "memory", "bitmap", "blend" ])
+def test_dots_match_dot(tmp_path, pen, brightest, kind):
+    coordinates, colors, opacities, radii = random_dots(brightest)
+    
+    def image(name):
+        if kind == "bitmap":
+            return raster.Raster_BMP_24RGB(str(tmp_path / name), 32, 24, (50, 50, 50), pen)
+        elif kind == "blend":
+            return raster.Raster_Float_RGB(32, 24, pen=pen, exposure=4)
+        else:
+            return raster.Raster_24RGB(32, 24, (50, 50, 50), pen) # so min has something to do
+    
+    one_at_a_time = image("dot.bmp")
+    
+    for dot in zip(coordinates, colors, opacities, [ pen ] * len(colors), radii):
+        one_at_a_time.dot(*dot)
+    
+    all_at_once = image("dots.bmp")
+    all_at_once.dots(coordinates, colors, opacities, pen, radii)
+    
+    assert all_at_once.copy().data == one_at_a_time.copy().data
+    
+    if not (kind == "blend" and pen is raster.PEN_MIN): # the least of no light is no light
+        assert all_at_once.copy().data != image("blank.bmp").copy().data
+
+def test_stamp_cache_evicts_least_recently_used():
+    stamps = raster.StampCache(size=2)
+    
+    stamps.lookup(0, 0, 1)
+    stamps.lookup(0, 0, 2)
+    stamps.lookup(0, 0, 1) # so radius 2 is the least recently used
+    stamps.lookup(0, 0, 3)
+    
+    assert len(stamps.stamps) == 2
+    assert [ key[0] for key in stamps.stamps ] == [ 8, 24 ]
+    assert stamps.stats()["hits"] == 1
+
+@pytest.mark.parametrize("size", [ 1, 3, 4096 ])
+def test_stamp_cache_eviction_draws_the_same(size):
+    coordinates, colors, opacities, radii = random_dots(40)
+    small, large = raster.StampCache(size=size), raster.StampCache(size=4096)
+    images = []
+    
+    for stamps in (small, large):
+        image = raster.Raster_24RGB(32, 24, pen=raster.PEN_ADD, stamps=stamps)
+        
+        # a few frames, so later ones reuse (or remake) earlier ones' stamps
+        for frame in range(3):
+            image.dots([ (x + frame / 8, y) for x, y in coordinates ], colors, opacities, radius=radii)
+        
+        images.append(image)
+    
+    assert len(small.stamps) <= size
+    assert images[0].data == images[1].data
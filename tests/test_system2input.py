@@ -0,0 +1,75 @@
+import json
+import math
+import os
+
+import numpy
+import pytest
+
+import gravity
+import system2input
+
+SOL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sol.system.json")
+
+@pytest.mark.parametrize("e", [ 0, .3, .8, .9, .99, .995, .999, .9999 ])
+def test_solve_kepler_converges(e):
+    M = numpy.linspace(-4 * math.pi, 4 * math.pi, 200001)
+    E = system2input.solve_kepler(M, numpy.full_like(M, e))
+    
+    assert abs(E - e * numpy.sin(E) - M).max() < 1e-12
+
+def test_solve_kepler_floats():
+    for M in (0, 1e-3, -3, 7, 1e5):
+        E = system2input.solve_kepler(float(M), .999)
+        
+        assert abs(E - .999 * math.sin(E) - M) < 1e-9
+
+def inclined_sol():
+    with open(SOL, "rt") as system_file:
+        system = json.load(system_file)
+    
+    system["sol"]["satellites"]["earth"]["orbit"]["inclination"] = 30
+    
+    return system
+
+def test_inclined_system_uses_numpy_engine():
+    input_dict = system2input.system_to_input(inclined_sol())
+    
+    assert input_dict["engine"] == "numpy"
+    assert all(len(o["d"]) == 3 for o in input_dict["objects"])
+    
+    with open(SOL, "rt") as system_file:
+        assert "engine" not in system2input.system_to_input(json.load(system_file))
+
+def test_engines_agree_in_3d():
+    objects = [ gravity.Object.from_dict(d) for d in system2input.system_to_input(inclined_sol())["objects"] ]
+    time_step = 60 * 60
+    steps = 24 * 20
+    
+    def final_positions(engine, **options):
+        frames = gravity.engines[engine](objects, time_step, system2input.G, **options)
+        
+        for _ in range(steps + 1):
+            frame = next(frames)
+        
+        return numpy.array([ list(o.displacement) for o in frame ])
+    
+    numpy_positions = final_positions("numpy")
+    tree_positions = final_positions("barnes-hut", theta=0)
+    
+    assert abs(numpy_positions[:, 2]).max() > 1e9
+    assert numpy.allclose(numpy_positions, tree_positions, rtol=1e-9, atol=1)
+    
+    with pytest.raises(ValueError):
+        final_positions("python")
+
+def test_inclined_system_renders_with_barnes_hut(tmp_path):
+    input_dict = system2input.system_to_input(inclined_sol())
+    input_dict.update(engine="barnes-hut", frames=3, dimensions=[ 64, 64 ], zoom=1e-9 / 16)
+    
+    in_filename = tmp_path / "input.json"
+    out_filename = tmp_path / "out.bmp"
+    in_filename.write_text(json.dumps(input_dict))
+    
+    gravity.main(str(in_filename), str(out_filename))
+    
+    assert out_filename.read_bytes()[:2] == b"BM"
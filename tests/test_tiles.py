@@ -0,0 +1,46 @@
+import random
+
+import numpy
+import pytest
+
+import gravity
+import raster
+import tiles
+
+@pytest.mark.parametrize("pen", [ "add", "max" ])
+def test_tiles_draw_the_same_as_one_image(pen):
+    generator = random.Random(2)
+    images = [ raster.Raster_24RGB(70, 45, pen=tiles.PENS[pen]) for _ in range(2) ]
+    renderer = tiles.TiledRenderer(images[1], pen=pen, tile_size=16, processes=2, batch_size=50)
+    
+    try:
+        # a few frames, faded between, with dots across tiles' edges and the image's
+        for frame in range(4):
+            coordinates = [ (generator.uniform(-5, 75), generator.uniform(-5, 50)) for _ in range(60) ]
+            colors = [ (generator.randrange(40), generator.randrange(40), generator.randrange(40))
+                       for _ in range(60) ]
+            radii = [ generator.choice([ .5, 1.5, 6 ]) for _ in range(60) ]
+            
+            images[0].dots(coordinates, colors, .8, radius=radii)
+            renderer.dots(coordinates, colors, .8, radius=radii)
+            
+            renderer.sync()
+            
+            for image in images:
+                image.fade(.5)
+            
+            renderer.load()
+    finally:
+        renderer.close()
+    
+    assert numpy.asarray(images[0].data).any()
+    assert images[0].data == images[1].data
+
+def test_main_draws_the_same_in_tiles(tmp_path, dusty_input):
+    gravity.main(dusty_input(), str(tmp_path / "whole.bmp"))
+    gravity.main(dusty_input("tiled.json", processes=2, tile_size=16), str(tmp_path / "tiled.bmp"))
+    
+    whole = (tmp_path / "whole.bmp").read_bytes()
+    
+    assert any(whole[54:])
+    assert (tmp_path / "tiled.bmp").read_bytes() == whole
@@ -0,0 +1,22 @@
+import pytest
+
+import gravity
+
+@pytest.mark.parametrize("engine", [ "python", "numpy" ])
+def test_replay_matches_simulating(tmp_path, dusty_input, engine):
+    recorded = str(tmp_path / "recorded.traj")
+    gravity.main(dusty_input(engine=engine, trajectory=recorded), str(tmp_path / "recorded.bmp"))
+    
+    # the same view, and another one, drawn from the recording and by simulating again
+    other_view = { "dimensions": [ 40, 40 ], "centre": [ 20, -10 ], "zoom": .5 }
+    
+    for name, view in [ ("same", {}), ("other", other_view) ]:
+        gravity.main(dusty_input(engine=engine, **view), str(tmp_path / (name + ".bmp")))
+        gravity.main(dusty_input("replay.json", replay=recorded, **view), str(tmp_path / (name + "_replayed.bmp")))
+        
+        simulated = (tmp_path / (name + ".bmp")).read_bytes()
+        
+        assert any(simulated[54:])
+        assert (tmp_path / (name + "_replayed.bmp")).read_bytes() == simulated
+    
+    assert (tmp_path / "recorded.bmp").read_bytes() == (tmp_path / "same.bmp").read_bytes()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+from multiprocessing import shared_memory
+import math
+import multiprocessing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import raster
+
+# The image is split into tiles, each held in its own block of shared
+# memory, and dots are routed to every tile their bounding box overlaps.
+# A pool of processes then draws tiles in parallel, each tile being
+# drawn by only one process at a time. Since the pens used give the same
+# result whatever order dots are drawn in, this gives the same image as
+# drawing every dot into the whole image in order.
+
+PENS = { "add": raster.PEN_ADD,
+         "min": raster.PEN_MIN,
+         "max": raster.PEN_MAX }
+
+# each worker process's StampCache, if tiles are drawn with one
+_stamps = None
+
+def _init_worker(stamps):
+    global _stamps
+    _stamps = raster.StampCache(**stamps) if stamps is not None else None
+
+def _draw_tile(task):
+    """Draws dots into one tile's shared memory, in a worker process,
+    returning the number of pixels drawn to."""
+    
+    name, width, height, pen, coordinates, colors, opacities, radii = task
+    
+    memory = shared_memory.SharedMemory(name=name)
+    
+    try:
+        tile = raster.Raster_24RGB(0, 0, pen=PENS[pen], stamps=_stamps)
+        tile.width, tile.height, tile.data = width, height, memory.buf
+        
+        touched = tile.dots(coordinates, colors, opacities, radius=radii)
+        
+        tile.data = None # so the buffer can be released
+    finally:
+        memory.close()
+    
+    return touched
+
+class Tile(object):
+    """A rectangle of an image, held in shared memory."""
+    
+    __slots__ = ("x", "y", "width", "height", "memory")
+    
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.memory = shared_memory.SharedMemory(create=True, size=max(1, width * height * 3))
+
+class TiledRenderer(object):
+    """Draws dots into a Raster_24RGB using a pool of processes.
+    
+    Dots given to dots() are collected until there are batch_size of them,
+    then drawn; sync() draws any waiting and copies the tiles back into
+    the image. pen must be one of PENS. stamps is the arguments of a
+    StampCache for each process to use, if any. touched counts the pixels
+    drawn to so far."""
+    
+    def __init__(self, image, pen="max", tile_size=256, processes=None,
+                 batch_size=1 << 16, stamps=None):
+        if pen not in PENS:
+            raise ValueError("tiles can only be drawn with the {} pens, not {!r}"
+                             .format(", ".join(sorted(PENS)), pen))
+        
+        self.image = image
+        self.pen = pen
+        self.tile_size = tile_size
+        self.batch_size = batch_size
+        self.columns = math.ceil(image.width / tile_size)
+        self.rows = math.ceil(image.height / tile_size)
+        
+        self.tiles = [ Tile(x, y, min(tile_size, image.width - x), min(tile_size, image.height - y))
+                       for y in range(0, image.height, tile_size)
+                       for x in range(0, image.width, tile_size) ]
+        
+        self.pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(stamps,))
+        self.pending = []
+        self.pending_count = 0
+        self.touched = 0
+        
+        self.load()
+    
+    def load(self):
+        """Copies the image into the tiles, eg. after it's been faded."""
+        
+        for tile in self.tiles:
+            row_bytes = tile.width * 3
+            
+            for row in range(tile.height):
+                tile.memory.buf[row * row_bytes:(row + 1) * row_bytes] = \
+                    self.image.get_span(tile.x, tile.y + row, tile.width)
+    
+    def sync(self):
+        """Draws any waiting dots and copies the tiles into the image."""
+        
+        self.flush()
+        
+        for tile in self.tiles:
+            row_bytes = tile.width * 3
+            
+            for row in range(tile.height):
+                self.image.set_span(tile.x, tile.y + row,
+                                    tile.memory.buf[row * row_bytes:(row + 1) * row_bytes])
+    
+    def dots(self, coordinates, color, opacity=1, radius=.5):
+        """Like Raster_24RGB.dots()."""
+        
+        count = len(coordinates)
+        
+        if not count:
+            return
+        
+        # colors are all made floats (0 to 1) so they can be batched together
+        if numpy is not None:
+            coordinates = numpy.asarray(coordinates, dtype=numpy.float64).reshape(-1, 2)
+            colors = numpy.asarray(color)
+            
+            if colors.dtype.kind != "f":
+                colors = colors / 255
+            
+            self.pending.append((coordinates,
+                                 numpy.broadcast_to(colors, (count, 3)),
+                                 numpy.broadcast_to(numpy.asarray(opacity, dtype=numpy.float64), (count,)),
+                                 numpy.broadcast_to(numpy.asarray(radius, dtype=numpy.float64), (count,))))
+        else:
+            colors = color if hasattr(color[0], "__len__") else [ color ] * count
+            colors = [ c if isinstance(c[0], float) else [ i / 255 for i in c ] for c in colors ]
+            
+            self.pending.append(([ list(c) for c in coordinates ], colors,
+                                 opacity if hasattr(opacity, "__len__") else [ opacity ] * count,
+                                 radius if hasattr(radius, "__len__") else [ radius ] * count))
+        
+        self.pending_count += count
+        
+        if self.pending_count >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        """Draws any waiting dots."""
+        
+        if not self.pending:
+            return
+        
+        if numpy is not None:
+            batches = self._route_numpy()
+        else:
+            batches = self._route()
+        
+        self.pending = []
+        self.pending_count = 0
+        
+        tasks = [ (self.tiles[t].memory.name, self.tiles[t].width, self.tiles[t].height, self.pen) + batch
+                  for t, batch in batches.items() ]
+        
+        self.touched += sum(self.pool.map(_draw_tile, tasks))
+    
+    def _route_numpy(self):
+        """Returns a dict of tile indices and the dots to draw in them,
+        relative to the tile, as numpy arrays."""
+        
+        coordinates, colors, opacities, radii = (numpy.concatenate(arrays) for arrays in zip(*self.pending))
+        
+        # the most distant pixel dot() could touch is within radius + 2
+        lows = numpy.floor((coordinates - (radii + 2)[:, numpy.newaxis]) / self.tile_size).astype(numpy.int64)
+        highs = numpy.floor((coordinates + (radii + 2)[:, numpy.newaxis]) / self.tile_size).astype(numpy.int64)
+        
+        lows = numpy.maximum(lows, 0)
+        highs = numpy.minimum(highs, [ self.columns - 1, self.rows - 1 ])
+        spans = highs - lows
+        
+        dot_indices, tile_indices = [], []
+        
+        for dx in range(spans[:, 0].max(initial=-1) + 1):
+            for dy in range(spans[:, 1].max(initial=-1) + 1):
+                inside = numpy.flatnonzero((spans[:, 0] >= dx) & (spans[:, 1] >= dy))
+                
+                dot_indices.append(inside)
+                tile_indices.append((lows[inside, 1] + dy) * self.columns + lows[inside, 0] + dx)
+        
+        if not dot_indices:
+            return {}
+        
+        dot_indices = numpy.concatenate(dot_indices)
+        tile_indices = numpy.concatenate(tile_indices)
+        
+        order = numpy.argsort(tile_indices, kind="stable")
+        dot_indices, tile_indices = dot_indices[order], tile_indices[order]
+        
+        tiles, starts = numpy.unique(tile_indices, return_index=True)
+        batches = {}
+        
+        for t, selected in zip(tiles.tolist(), numpy.split(dot_indices, starts[1:])):
+            tile = self.tiles[t]
+            
+            batches[t] = (coordinates[selected] - [ tile.x, tile.y ],
+                          colors[selected], opacities[selected], radii[selected])
+        
+        return batches
+    
+    def _route(self):
+        """Like _route_numpy(), with lists."""
+        
+        batches = {}
+        
+        for coordinates, colors, opacities, radii in self.pending:
+            for (x, y), color, opacity, radius in zip(coordinates, colors, opacities, radii):
+                columns = range(max(0, math.floor((x - radius - 2) / self.tile_size)),
+                                min(self.columns - 1, math.floor((x + radius + 2) / self.tile_size)) + 1)
+                rows = range(max(0, math.floor((y - radius - 2) / self.tile_size)),
+                             min(self.rows - 1, math.floor((y + radius + 2) / self.tile_size)) + 1)
+                
+                for row in rows:
+                    for column in columns:
+                        t = row * self.columns + column
+                        tile = self.tiles[t]
+                        batch = batches.setdefault(t, ([], [], [], []))
+                        
+                        batch[0].append((x - tile.x, y - tile.y))
+                        batch[1].append(color)
+                        batch[2].append(opacity)
+                        batch[3].append(radius)
+        
+        return batches
+    
+    def close(self):
+        """Releases the pool and shared memory; sync() first to keep
+        anything drawn since the last sync()."""
+        
+        self.pool.close()
+        self.pool.join()
+        
+        for tile in self.tiles:
+            tile.memory.close()
+            tile.memory.unlink()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+from array import array
+from struct import Struct
+import json
+import mmap
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from binary import padding, little_endian
+from bodies import Object, System, numpy_views
+
+# A trajectory file records the positions, radii and masses of a
+# simulation's bodies in every frame drawn, so it can be drawn again
+# with a different view without simulating it again.
+#
+# - HEADER, then its metadata as JSON, eg. the frames and draw_every it
+#   was simulated with
+# - chunks of consecutive frames with the same number of bodies; a new
+#   chunk is started whenever bodies merge. Each is a CHUNK_HEADER then
+#   the chunk's frame numbers (unsigned 64-bit ints), positions (frames
+#   x bodies x dimensions), radii and masses (frames x bodies) as
+#   floats of itemsize bytes
+# - an index of the chunks, INDEX_ENTRY each, and then TRAILER
+#
+# Everything is little-endian and each array starts on a multiple of 8
+# bytes, so readers can map the arrays straight out of the file. If the
+# recording was cut short, there's no index and the chunks are found by
+# reading through them instead.
+
+MAGIC = b"gravtraj"
+VERSION = 1
+
+HEADER = Struct("<8sIIII") # MAGIC, VERSION, dimensions, itemsize, metadata length
+CHUNK_HEADER = Struct("<QQ") # frames, bodies
+INDEX_ENTRY = Struct("<QQQ") # offset of chunk's arrays, frames, bodies
+TRAILER = Struct("<QQ8s") # offset of index, chunks, MAGIC
+
+TYPECODES = { 4: "f", 8: "d" }
+
+class Frame(object):
+    """The positions, radii and masses of the bodies in one frame of a
+    trajectory: numpy arrays viewing into the file if numpy is available,
+    or lists otherwise. Iterating over it gives Objects at rest."""
+    
+    __slots__ = ("frame", "positions", "radii", "masses")
+    
+    def __init__(self, frame, positions, radii, masses):
+        self.frame = frame
+        self.positions = positions
+        self.radii = radii
+        self.masses = masses
+    
+    def __len__(self):
+        return len(self.masses)
+    
+    def __iter__(self):
+        for position, radius, mass in zip(self.positions, self.radii, self.masses):
+            yield Object(float(mass), list(position), [ 0 ] * len(position), float(radius))
+
+class Recorder(object):
+    """Writes frames to a trajectory file, chunk_frames at a time.
+    
+    itemsize is 8 to record doubles, which draw exactly like the original
+    frames, or 4 for floats, which take half the space. close() when done
+    to write the index."""
+    
+    def __init__(self, filename, dimensions, itemsize=8, chunk_frames=64, metadata=None):
+        if itemsize not in TYPECODES:
+            raise ValueError("can only record 4- or 8-byte floats, not {}".format(itemsize))
+        
+        self.dimensions = dimensions
+        self.itemsize = itemsize
+        self.chunk_frames = chunk_frames
+        self.index = []
+        self.pending = []
+        
+        metadata = json.dumps(metadata or {}).encode("utf-8")
+        
+        self.file = open(filename, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, dimensions, itemsize, len(metadata)))
+        self.file.write(metadata + padding(HEADER.size + len(metadata)))
+    
+    def _arrays(self, objects):
+        """Returns the bytes of a frame's positions, radii and masses."""
+        
+        if numpy is not None and isinstance(objects, System) and objects.dimensions == self.dimensions:
+            masses, displacements, velocities, radii, combining = numpy_views(objects)
+            dtype = "<f{}".format(self.itemsize)
+            
+            return (displacements.astype(dtype).tobytes(),
+                    radii.astype(dtype).tobytes(),
+                    masses.astype(dtype).tobytes())
+        
+        typecode = TYPECODES[self.itemsize]
+        positions, radii, masses = array(typecode), array(typecode), array(typecode)
+        
+        for object in objects:
+            position = list(object.displacement)
+            positions.extend(position + [ 0 ] * (self.dimensions - len(position)))
+            radii.append(object.radius)
+            masses.append(object.mass)
+        
+        return tuple(little_endian(values).tobytes() for values in (positions, radii, masses))
+    
+    def append(self, frame, objects):
+        """Records a frame of a simulation, numbered frame."""
+        
+        count = len(objects)
+        
+        if self.pending and (self.pending[0][1] != count or len(self.pending) >= self.chunk_frames):
+            self.flush()
+        
+        self.pending.append((frame, count) + self._arrays(objects))
+    
+    def flush(self):
+        """Writes any frames waiting to be written as a chunk."""
+        
+        if not self.pending:
+            return
+        
+        frames, bodies = len(self.pending), self.pending[0][1]
+        
+        self.file.write(CHUNK_HEADER.pack(frames, bodies))
+        self.index.append((self.file.tell(), frames, bodies))
+        
+        frame_numbers = little_endian(array("Q", [ frame for frame, *_ in self.pending ])).tobytes()
+        
+        for data in (frame_numbers,
+                     b"".join(positions for _, _, positions, _, _ in self.pending),
+                     b"".join(radii for _, _, _, radii, _ in self.pending),
+                     b"".join(masses for _, _, _, _, masses in self.pending)):
+            self.file.write(data + padding(len(data)))
+        
+        self.pending = []
+    
+    def close(self):
+        self.flush()
+        
+        index_offset = self.file.tell()
+        
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        
+        self.file.write(TRAILER.pack(index_offset, len(self.index), MAGIC))
+        self.file.close()
+
+class Reader(object):
+    """Reads a trajectory file, by memory-mapping it."""
+    
+    def __init__(self, filename):
+        self.file = open(filename, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        magic, version, self.dimensions, self.itemsize, metadata_size = HEADER.unpack_from(self.map, 0)
+        
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a version {} trajectory".format(VERSION))
+        
+        self.metadata = json.loads(self.map[HEADER.size:HEADER.size + metadata_size].decode("utf-8"))
+        self.data_offset = HEADER.size + metadata_size + len(padding(HEADER.size + metadata_size))
+        
+        self.chunks = self._read_index()
+        
+        if self.chunks is None:
+            self.chunks = self._scan()
+    
+    def _chunk_sizes(self, frames, bodies):
+        """Returns the sizes of a chunk's arrays, padding included."""
+        
+        return [ size + len(padding(size))
+                 for size in (frames * 8,
+                              frames * bodies * self.dimensions * self.itemsize,
+                              frames * bodies * self.itemsize,
+                              frames * bodies * self.itemsize) ]
+    
+    def _read_index(self):
+        if len(self.map) < self.data_offset + TRAILER.size:
+            return None
+        
+        index_offset, count, magic = TRAILER.unpack_from(self.map, len(self.map) - TRAILER.size)
+        
+        if magic != MAGIC:
+            return None
+        
+        return [ INDEX_ENTRY.unpack_from(self.map, index_offset + i * INDEX_ENTRY.size)
+                 for i in range(count) ]
+    
+    def _scan(self):
+        """Finds the complete chunks of a file which has no index."""
+        
+        chunks = []
+        offset = self.data_offset
+        
+        while offset + CHUNK_HEADER.size <= len(self.map):
+            frames, bodies = CHUNK_HEADER.unpack_from(self.map, offset)
+            offset += CHUNK_HEADER.size
+            size = sum(self._chunk_sizes(frames, bodies))
+            
+            if not frames or offset + size > len(self.map):
+                break
+            
+            chunks.append((offset, frames, bodies))
+            offset += size
+        
+        return chunks
+    
+    def __len__(self):
+        return sum(frames for offset, frames, bodies in self.chunks)
+    
+    def frame_numbers(self):
+        """Returns a list of the number of each frame."""
+        
+        return [ int(f) for offset, frames, bodies in self.chunks
+                        for f in self._array(offset, frames, "Q") ]
+    
+    def _array(self, offset, count, typecode):
+        if numpy is not None:
+            dtype = "<u8" if typecode == "Q" else "<f{}".format(self.itemsize)
+            return numpy.frombuffer(self.map, dtype=dtype, count=count, offset=offset)
+        
+        values = array(typecode, self.map[offset:offset + count * array(typecode).itemsize])
+        return little_endian(values)
+    
+    def frames(self, start=0):
+        """Yields each Frame, from the start-th on."""
+        
+        typecode = TYPECODES[self.itemsize]
+        d = self.dimensions
+        
+        for offset, frames, bodies in self.chunks:
+            if start >= frames:
+                start -= frames
+                continue
+            
+            sizes = self._chunk_sizes(frames, bodies)
+            offsets = [ offset + sum(sizes[:i]) for i in range(4) ]
+            
+            frame_numbers = self._array(offsets[0], frames, "Q")
+            positions = self._array(offsets[1], frames * bodies * d, typecode)
+            radii = self._array(offsets[2], frames * bodies, typecode)
+            masses = self._array(offsets[3], frames * bodies, typecode)
+            
+            for i in range(start, frames):
+                b = i * bodies
+                
+                if numpy is not None:
+                    frame_positions = positions[b * d:(b + bodies) * d].reshape(bodies, d)
+                else:
+                    frame_positions = [ positions[(b + k) * d:(b + k + 1) * d] for k in range(bodies) ]
+                
+                yield Frame(int(frame_numbers[i]), frame_positions,
+                            radii[b:b + bodies], masses[b:b + bodies])
+            
+            start = 0
+    
+    def close(self):
+        try:
+            self.map.close()
+        except BufferError:
+            pass # frames are still viewing it; it's closed once they're gone
+        
+        self.file.close()
+
+def main(trajectory_filename, in_filename="-", out_filename="-"):
+    """Draws a recorded trajectory with the view and drawing options of a
+    gravity.py input file, without simulating it again."""
+    
+    import gravity
+    
+    return gravity.main(in_filename, out_filename, overrides={ "replay": trajectory_filename })
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
@@ -9,14 +9,33 @@ def sqrt(n):
     return n ** .5
 
 class Vector(object):
-    """A Vector value of any number of dimensions."""
+    """A Vector value of any number of dimensions.
+
+    2D and 3D Vectors, which are nearly all we use, have their arithmetic
+    unrolled instead of going through zip_longest and a generator."""
+    
+    __slots__ = ("components",)
     
     def __init__(self, components):
         self.components = list(components)
 
+    def _new(self, components):
+        """Returns a Vector of our type owning the given list, without copying it."""
+        
+        vector = object.__new__(type(self))
+        vector.components = components
+        return vector
+
     @property
     def magnitude(self):
-        return sum(x ** 2 for x in self.components) ** (1/2)
+        c = self.components
+        
+        if len(c) == 2:
+            return (c[0] ** 2 + c[1] ** 2) ** (1/2)
+        elif len(c) == 3:
+            return (c[0] ** 2 + c[1] ** 2 + c[2] ** 2) ** (1/2)
+        
+        return sum(x ** 2 for x in c) ** (1/2)
     
     @magnitude.setter
     def magnitude(self, value):
@@ -28,22 +47,51 @@ class Vector(object):
     def __setitem__(self, index, value):
         self.components[index] = value
     
+    def _added(self, vector):
+        a, b = self.components, vector.components
+        
+        if len(a) == len(b):
+            if len(a) == 2:
+                return [ a[0] + b[0], a[1] + b[1] ]
+            elif len(a) == 3:
+                return [ a[0] + b[0], a[1] + b[1], a[2] + b[2] ]
+        
+        return [ x + y for (x, y) in itertools.zip_longest(a, b, fillvalue=0) ]
+    
+    def _subtracted(self, vector):
+        a, b = self.components, vector.components
+        
+        if len(a) == len(b):
+            if len(a) == 2:
+                return [ a[0] - b[0], a[1] - b[1] ]
+            elif len(a) == 3:
+                return [ a[0] - b[0], a[1] - b[1], a[2] - b[2] ]
+        
+        return [ x - y for (x, y) in itertools.zip_longest(a, b, fillvalue=0) ]
+    
     def __add__(self, vector):
-        return type(self)(a + b for (a, b) in itertools.zip_longest(self.components, vector.components, fillvalue=0))
+        return self._new(self._added(vector))
     
     def __iadd__(self, vector):
-        self.components = [a + b for (a, b) in itertools.zip_longest(self.components, vector.components, fillvalue=0)]
+        self.components = self._added(vector)
         return self
     
     def __sub__(self, vector):
-        return type(self)(a - b for (a, b) in itertools.zip_longest(self.components, vector.components, fillvalue=0))
+        return self._new(self._subtracted(vector))
     
     def __isub__(self, vector):
-        self.components = [a - b for (a, b) in itertools.zip_longest(self.components, vector.components, fillvalue=0)]
+        self.components = self._subtracted(vector)
         return self
     
     def __mul__(self, scalar):
-        return type(self)(x * scalar for x in self.components)
+        c = self.components
+        
+        if len(c) == 2:
+            return self._new([ c[0] * scalar, c[1] * scalar ])
+        elif len(c) == 3:
+            return self._new([ c[0] * scalar, c[1] * scalar, c[2] * scalar ])
+        
+        return self._new([ x * scalar for x in c ])
     
     __rmul__ = __mul__
     
@@ -52,20 +100,28 @@ class Vector(object):
         return self
     
     def __truediv__(self, scalar):
-        return type(self)(x / scalar for x in self.components)
+        c = self.components
+        
+        if len(c) == 2:
+            return self._new([ c[0] / scalar, c[1] / scalar ])
+        elif len(c) == 3:
+            return self._new([ c[0] / scalar, c[1] / scalar, c[2] / scalar ])
+        
+        return self._new([ x / scalar for x in c ])
     
     def __itruediv__(self, scalar):
         self.components = [x / scalar for x in self.components]
         return self
     
     def __floordiv__(self, scalar):
-        return type(self)(x // scalar for x in self.components)
+        return self._new([ x // scalar for x in self.components ])
     
     def __ifloordiv__(self, scalar):
         self.components = [x // scalar for x in self.components]
+        return self
     
     def __neg__(self):
-        return type(self)(-x for x in self.components)
+        return self._new([ -x for x in self.components ])
 
     def __iter__(self):
         return iter(self.components)